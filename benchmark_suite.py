@@ -0,0 +1,155 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : benchmark_suite.py
+# @IDE     : PyCharm
+"""
+Benchmark suite: every circuit of qasm-benchmark/ on every chip of coupling/ with every strategy,
+compiled without slicing on a process pool.
+
+One CSV row is appended per (circuit, chip, strategy, backend) as soon as it is done, and rows
+already in the file are skipped on the next run, so an interrupted sweep resumes where it stopped.
+Failed compiles (unparsable qasm, circuit larger than the chip, missing router binary, ...) are
+recorded with their error and retried on the next run, a retry that succeeds appends a new row.
+
+usage: python benchmark_suite.py result.csv [backend] [strategy ...]
+"""
+import os
+import sys
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from compile import compile_without_slice, load_circuit
+from parallel import default_workers
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(ROOT, "qasm-benchmark")
+COUPLING_DIR = os.path.join(ROOT, "coupling")
+STRATEGIES = ["nogreedy", "greedy", "search"]
+COLUMNS = ["circuit", "chip", "strategy", "backend", "qubits", "gates", "depth",
+           "compiler_time", "compiler_depth", "swap_count", "wall_time", "error"]
+
+
+def find_circuits(benchmark_dir=BENCHMARK_DIR):
+    """
+    Returns:
+        qasm files under benchmark_dir, relative to it, sorted
+    """
+    circuits = []
+    for root, dirs, files in os.walk(benchmark_dir):
+        for file in files:
+            if file.endswith(".qasm"):
+                circuits.append(os.path.relpath(os.path.join(root, file), benchmark_dir))
+    return sorted(circuits)
+
+
+def find_chips(coupling_dir=COUPLING_DIR):
+    return sorted(file for file in os.listdir(coupling_dir) if os.path.isfile(os.path.join(coupling_dir, file)))
+
+
+def run_key(row):
+    return row["circuit"], row["chip"], row["strategy"], row["backend"]
+
+
+def load_done(result_file):
+    """
+    Read the rows of an earlier run. A last line cut by an interruption is removed from the file
+    so new rows are appended after a complete one.
+
+    Returns:
+        set of the (circuit, chip, strategy, backend) that completed without error in result_file
+    """
+    if not os.path.exists(result_file):
+        return set()
+    with open(result_file, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+    with open(result_file, newline="") as f:
+        return {run_key(row) for row in csv.DictReader(f) if not row["error"]}
+
+
+def run_benchmark(circuit, chip, strategy, backend):
+    """
+    compile one (circuit, chip, strategy) without slicing, errors are returned in the row
+
+    Returns:
+        the CSV row, see COLUMNS
+    """
+    row = dict.fromkeys(COLUMNS, "")
+    row.update(circuit=circuit, chip=chip, strategy=strategy, backend=backend)
+    start = time.perf_counter()
+    try:
+        qc = load_circuit(os.path.join(BENCHMARK_DIR, circuit))
+        row.update(qubits=qc.get_qubit_number(), gates=qc.get_gate_number() - 1, depth=qc.get_circuit_depth() - 1)
+        # the initial mapping is derived with VF2 (see compile.initial_map), every run is routed, not read from the cache
+        compile_result = compile_without_slice(qc, os.path.join(COUPLING_DIR, chip), None, strategy, None, backend,
+                                               use_cache=False)
+        row.update(compiler_time=compile_result.compiler_time, compiler_depth=compile_result.compiler_depth,
+                   swap_count=compile_result.swap_count)
+    except Exception as e:
+        row["error"] = "%s: %s" % (type(e).__name__, str(e).splitlines()[0] if str(e) else "")
+    row["wall_time"] = time.perf_counter() - start
+    return row
+
+
+def run_suite(result_file, backend="EEQM_scale", strategies=STRATEGIES, circuits=None, chips=None, max_workers=None):
+    """
+    Args:
+        circuits: qasm files relative to qasm-benchmark/, all of them if None
+        chips: files of coupling/, all of them if None
+        max_workers: pool size, the cores available to this process if None
+
+    Returns:
+        number of runs done by this call
+    """
+    if circuits is None:
+        circuits = find_circuits()
+    if chips is None:
+        chips = find_chips()
+    done = load_done(result_file)
+    # largest circuits first so the pool does not end waiting on one long compile
+    circuits = sorted(circuits, key=lambda circuit: -os.path.getsize(os.path.join(BENCHMARK_DIR, circuit)))
+    runs = [(circuit, chip, strategy) for circuit in circuits for chip in chips for strategy in strategies
+            if (circuit, chip, strategy, backend) not in done]
+    print("runs: {} done: {} to run: {}".format(len(circuits) * len(chips) * len(strategies),
+                                                len(done), len(runs)))
+    if not runs:
+        return 0
+    write_header = not os.path.exists(result_file) or os.path.getsize(result_file) == 0
+    with open(result_file, "a", newline="") as f, \
+            ProcessPoolExecutor(max_workers=max_workers or default_workers()) as executor:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if write_header:
+            writer.writeheader()
+        futures = [executor.submit(run_benchmark, circuit, chip, strategy, backend)
+                   for circuit, chip, strategy in runs]
+        for finished, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            writer.writerow(row)
+            # every finished run is on disk before the next one is waited for
+            f.flush()
+            os.fsync(f.fileno())
+            print("[{}/{}] {} {} {} {}".format(finished, len(runs), row["circuit"], row["chip"], row["strategy"],
+                                                row["error"] or row["compiler_depth"]))
+    return len(runs)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        exit(0)
+    result_file = sys.argv[1]
+    backend = sys.argv[2] if len(sys.argv) > 2 else "EEQM_scale"
+    strategies = sys.argv[3:] or STRATEGIES
+    run_suite(result_file, backend, strategies)
@@ -17,7 +17,7 @@
 # @IDE     : PyCharm
 import os
 import numpy as np
-from quantumcircuit import QuantumCircuit
+from quantumcircuit import QuantumCircuit, CircuitView
 
 def get_gates(layer):
     cnot_gates = []
@@ -38,114 +38,234 @@ def get_gates(layer):
     return signle_gates, cnot_gates
 
 
-def cut_circuit_depth(file_path, write_path, slice_depth):
+def get_layers_gates(dagtable):
     """
+    get_gates for every layer of a dagtable in one pass
     Args:
-        file_path: read from qasm file
-        write_path: write to a directory
-        slice_depth: the depth of each circuit slice
+        dagtable: 2D array, rows are qubits and columns are layers
 
     Returns:
-        None
+        list, item l is (single_gates, cnot_gates) of layer l,
+        in the same format and order as get_gates(dagtable[:, l])
+    """
+    dagtable = np.asarray(dagtable)
+    layer_number = dagtable.shape[1]
+    # busy cells in (layer, qubit) order, as get_gates scans each column
+    layers, qubits = np.nonzero(dagtable.T != -1)
+    gate_ids = dagtable[qubits, layers]
+    cell_number = len(gate_ids)
+    # a gate occupies one cell (single) or two cells of the same layer (cnot)
+    _, first, counts = np.unique(gate_ids, return_index=True, return_counts=True)
+    _, last_reversed = np.unique(gate_ids[::-1], return_index=True)
+    last = cell_number - 1 - last_reversed
+    order = np.argsort(first, kind='stable')
+    first, last, counts = first[order], last[order], counts[order]
+    gate_layers = layers[first]
+    bounds = np.searchsorted(gate_layers, np.arange(layer_number + 1))
+    first_qubits = qubits[first].tolist()
+    second_qubits = qubits[last].tolist()
+    ids = gate_ids[first].tolist()
+    is_cnot = (counts == 2).tolist()
+    layers_gates = []
+    for layer in range(layer_number):
+        single_gates = []
+        cnot_gates = []
+        for k in range(bounds[layer], bounds[layer + 1]):
+            if is_cnot[k]:
+                cnot_gates.append([first_qubits[k], second_qubits[k], ids[k]])
+            else:
+                single_gates.append([first_qubits[k], ids[k]])
+        layers_gates.append((single_gates, cnot_gates))
+    return layers_gates
 
-    The circuit slices is written to files in write_path
+
+class LayerIndex:
     """
-    circuit = QuantumCircuit.from_QASM(file_path)
-    filename = file_path.split('/')[-1].split('.qasm')[0]
-    circuits_slices = []
-    dag_table = circuit.to_dagtable()
-    remaining_depth = circuit.get_circuit_depth() - 1
+    Gates of a circuit in the order the slicers take them: layer by layer, and inside a layer
+    the cnots then the single-qubit gates, each by decreasing first qubit
+    (the pop order of cut_circuit_gate over get_layers_gates).
+    With the prefix sums over that order every window is a range found in O(log n).
     """
-        Todo: circuit depth update
+
+    def __init__(self, circuit):
+        """
+        Args:
+            circuit: QuantumCircuit
+        """
+        self.circuit = circuit
+        qubit0, qubit1 = circuit.get_gate_qubits()
+        layers = circuit.get_gate_layers()[1:]
+        is_cnot = qubit1 != -1
+        first_qubit = np.where(is_cnot, np.minimum(qubit0, qubit1), qubit0)
+        order = np.lexsort((-first_qubit, ~is_cnot, layers))
+        self.gate_ids = (order + 1).astype(np.int32)
+        self.layers = layers[order]
+        # cumulative_weight[k]: weight of the first k gates, a cnot weighs 2 and a single-qubit gate 1
+        self.cumulative_weight = np.concatenate(([0], np.cumsum(np.where(is_cnot[order], 2, 1))))
+        self.layer_number = circuit.get_circuit_depth() - 1
+        # layer_start[l]: position of the first gate of layer l, layer_start[layer_number] is the gate number
+        self.layer_start = np.searchsorted(self.layers, np.arange(self.layer_number + 1))
+        self._windows = {}
+
+    def total_weight(self):
+        return int(self.cumulative_weight[-1])
+
+    def window(self, begin, end):
+        """
+        Returns:
+            CircuitView of the gates at positions [begin, end),
+            the same object for the same range so equal slices are shared
+        """
+        key = (int(begin), int(end))
+        if key not in self._windows:
+            self._windows[key] = self._make_window(begin, end)
+        return self._windows[key]
+
+    def _make_window(self, begin, end):
+        layers = None
+        if begin == end:
+            layers = self.layers[begin:end]
+        elif self.layer_start[self.layers[begin]] == begin:
+            # from a layer boundary on, layers inside the window are the circuit ones shifted
+            layers = self.layers[begin:end] - self.layers[begin]
+        return CircuitView(self.circuit, self.gate_ids[begin:end], layers)
+
+    def depth_window(self, startlayer, depth):
+        """
+        Returns:
+            CircuitView of the layers [startlayer, startlayer + depth)
+        """
+        stop = min(startlayer + depth, self.layer_number)
+        return self.window(self.layer_start[startlayer], self.layer_start[stop])
+
+    def weight_end(self, begin, weight):
+        """
+        Returns:
+            the first position end with weight of [begin, end) >= weight, None if the gates run out
+        """
+        target = self.cumulative_weight[begin] + weight
+        if target > self.cumulative_weight[-1]:
+            return None
+        return max(int(np.searchsorted(self.cumulative_weight, target, side='left')), begin)
+
+    def gate_window(self, startlayer, weight):
+        """
+        Returns:
+            CircuitView of the gates from layer startlayer on until their weight reaches weight,
+            None if the circuit ends first
+        """
+        begin = self.layer_start[startlayer]
+        end = self.weight_end(begin, weight)
+        if end is None:
+            return None
+        return self.window(begin, end)
+
+    def gate_partition(self, slices):
+        """
+        Split the whole order into slices parts of about the same weight: part t ends at the
+        first position k with cumulative_weight[k] * slices >= (t + 1) * total weight.
+
+        Returns:
+            list of (begin, end) positions, empty parts left out
+        """
+        targets = np.arange(1, slices + 1) * self.total_weight()
+        ends = np.searchsorted(self.cumulative_weight * slices, targets, side='left')
+        ends[-1] = len(self.gate_ids)
+        begins = np.concatenate(([0], ends[:-1]))
+        return [(int(begin), int(end)) for begin, end in zip(begins, ends) if end > begin]
+
+    def last_depth_start(self, depth):
+        """
+        Returns:
+            the last layer a window of depth layers can start at, -1 if none fits
+        """
+        # an empty window fits everywhere, the last start is still the last layer
+        return max(self.layer_number - max(depth, 1), -1)
+
+    def last_weight_start(self, weight):
+        """
+        Returns:
+            the last layer a window of the given weight can start at, -1 if none fits
+        """
+        remaining = self.cumulative_weight[-1] - self.cumulative_weight[self.layer_start]
+        # remaining weight decreases with the start layer, layer_start[layer_number] is the end of the
+        # circuit and not a layer, a weight <= 0 fits at every layer up to the last one
+        return min(int(np.searchsorted(-remaining, -weight, side='right')) - 1, self.layer_number - 1)
+
+
+def slice_circuit_depth(circuit, slice_depth, layer_index=None):
+    """
+    Args:
+        circuit: QuantumCircuit
+        slice_depth: the depth of each circuit slice
+        layer_index: LayerIndex of circuit, built here if None
+
+    Returns:
+        list of CircuitView, slice i holds the dagtable layers [i*slice_depth, (i+1)*slice_depth)
     """
+    if layer_index is None:
+        layer_index = LayerIndex(circuit)
+    layer_number = layer_index.layer_number
     slice_num = int(circuit.get_circuit_depth() / slice_depth) + 1
-    for slice in range(slice_num):
-        circuit_slice = QuantumCircuit(qubit_number=circuit.qubit_number)
-        for i in range(slice_depth):
-            if remaining_depth <= 0:
-                break
-            # print(remaining_depth)
-            # print(i + slice * slice_depth)
-            gate_time = set([row[i + slice * slice_depth] for row in dag_table])
-            "set(), for the cnot gate id may occur twice."
-            "gate_id '-1' indicate none gate in gate list while gate_list[-1] means the last gate."
-            # print(gate_time)
-            for gate_id in gate_time:
-                # print(gate_id, end=' ')
-                if gate_id == -1:
-                    continue
-                gate = circuit.gate_list[gate_id]
-                circuit_slice.add_gate(gate)
-                # print(circuit_slice.get_circuit_depth())
-            remaining_depth -= 1
-        # print('------------------')
-        circuits_slices.append(circuit_slice)
-    write_file_path = os.path.join(write_path, filename)
-    if os.path.exists(write_file_path):
-        pass
-    else:
-        os.mkdir(write_file_path)
+    return [layer_index.window(layer_index.layer_start[min(i * slice_depth, layer_number)],
+                               layer_index.layer_start[min((i + 1) * slice_depth, layer_number)])
+            for i in range(slice_num)]
+
+
+def slice_circuit_gate(circuit, slices, layer_index=None):
+    """
+    Args:
+        circuit: QuantumCircuit
+        slices: number of slices, a cnot weighs 2 and a single-qubit gate 1
+        layer_index: LayerIndex of circuit, built here if None
+
+    Returns:
+        list of CircuitView with about the same weight each
+    """
+    if layer_index is None:
+        layer_index = LayerIndex(circuit)
+    return [layer_index.window(begin, end) for begin, end in layer_index.gate_partition(slices)]
+
+
+def write_slices(circuits_slices, write_file_path, prefix=''):
+    """
+    Archive slices as qasm files, write_file_path/<prefix>slice_<i>.qasm
+
+    Returns:
+        list of the written files
+    """
+    if not os.path.exists(write_file_path):
+        os.makedirs(write_file_path)
     files_list = []
-    for i in range(slice_num):
-        filename_slice = os.path.join(write_file_path, filename+'_slice_'+str(i)+'.qasm')
+    for i in range(len(circuits_slices)):
+        filename_slice = os.path.join(write_file_path, prefix+'slice_'+str(i)+'.qasm')
         files_list.append(filename_slice)
-        # print(filename_slice)
-        # print(circuits_slices[i].get_circuit_depth())
         circuits_slices[i].to_QASM(filename_slice)
-        # print(circuits_slices[i].to_dagtable())
     return files_list
 
-def cut_circuit_gate(file_path, write_path, slices):
-    circuit = QuantumCircuit.from_QASM(file_path)
-    dagtbale = np.array(circuit.to_dagtable())
-    total_gate_cnt = np.sum(np.where(dagtbale>0, 1, 0))
-    average_slice_gates = total_gate_cnt/slices
 
+def cut_circuit_depth(file_path, write_path, slice_depth):
+    """
+    Args:
+        file_path: read from qasm file
+        write_path: write to a directory
+        slice_depth: the depth of each circuit slice
 
+    Returns:
+        list of the slice files
+
+    The circuit slices is written to files in write_path
+    """
+    circuit = QuantumCircuit.from_QASM(file_path, lazy_dag=True)
     filename = file_path.split('/')[-1].split('.qasm')[0]
-    circuits_slices = []
-    nowlayer = 0
-    single_gates = []
-    cnot_gates = []
-    bias = 0
-    for slice in range(slices):
-        circuit_slice = QuantumCircuit(qubit_number=circuit.qubit_number)
-        tmp_gate_numbers = 0
-        while tmp_gate_numbers<average_slice_gates-bias:
-            if len(cnot_gates) != 0:
-                gate = circuit.gate_list[cnot_gates.pop()[-1]]
-                circuit_slice.add_gate(gate)
-                tmp_gate_numbers += 2
-            elif len(single_gates) != 0:
-                gate = circuit.gate_list[single_gates.pop()[-1]]
-                circuit_slice.add_gate(gate)
-                tmp_gate_numbers += 1
-            else:
-                if nowlayer<dagtbale.shape[1]:
-                    single_gates,cnot_gates = get_gates(dagtbale[:,nowlayer])
-                    nowlayer += 1
-                else:
-                    break
-
-        # print('------------------')
-        if tmp_gate_numbers>0:
-            circuits_slices.append(circuit_slice)
-            bias += tmp_gate_numbers - average_slice_gates
-    write_file_path = os.path.join(write_path, filename)
-    if os.path.exists(write_file_path):
-        pass
-    else:
-        os.mkdir(write_file_path)
-    files_list = []
-    for i in range(slices):
-        filename_slice = os.path.join(write_file_path, filename+'_slice_'+str(i)+'.qasm')
-        files_list.append(filename_slice)
-        # print(filename_slice)
-        # print(circuits_slices[i].get_circuit_depth())
-        circuits_slices[i].to_QASM(filename_slice)
-        # print(circuits_slices[i].to_dagtable())
-    return files_list
+    circuits_slices = slice_circuit_depth(circuit, slice_depth)
+    return write_slices(circuits_slices, os.path.join(write_path, filename), filename+'_')
 
+def cut_circuit_gate(file_path, write_path, slices):
+    circuit = QuantumCircuit.from_QASM(file_path, lazy_dag=True)
+    filename = file_path.split('/')[-1].split('.qasm')[0]
+    circuits_slices = slice_circuit_gate(circuit, slices)
+    return write_slices(circuits_slices, os.path.join(write_path, filename), filename+'_')
 
 
 def cut_circuit(file_path, write_path, method, args):
@@ -160,6 +280,40 @@ def cut_circuit(file_path, write_path, method, args):
         exit(0)
 
 
+def sweep_slices(circuit, method, args, layer_index=None):
+    """
+    Slices of circuit for every arg of a parameter sweep, all cut from one LayerIndex.
+    A slice that appears under several args is the same CircuitView object,
+    so it only has to be compiled once.
+
+    Args:
+        circuit: QuantumCircuit
+        method: 'depth' or 'gatecnt', see slice_circuit
+        args: slice depths or slice numbers
+        layer_index: LayerIndex of circuit, built here if None
 
+    Returns:
+        list of (arg, list of CircuitView), in the order of args
+    """
+    if layer_index is None:
+        layer_index = LayerIndex(circuit)
+    return [(arg, slice_circuit(circuit, method, arg, layer_index)) for arg in args]
 
 
+def slice_circuit(circuit, method, args, layer_index=None):
+    """
+    in-memory counterpart of cut_circuit, nothing is written to disk
+    layer_index: LayerIndex of circuit, pass the same one to slice the circuit for many args
+
+    Returns:
+        list of CircuitView
+    """
+    methods = {
+        'depth':slice_circuit_depth,
+        'gatecnt':slice_circuit_gate
+    }
+    if method in methods:
+        return methods[method](circuit, int(args), layer_index)
+    else:
+        print('unknow cut method:', method)
+        exit(0)
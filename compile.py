@@ -16,134 +16,285 @@
 # @File    : compile.py
 # @IDE     : PyCharm
 import os
-import re
 import sys
+import time
+import hashlib
+import inspect
+import tempfile
 import subprocess
-import numpy as np
 from quantumcircuit import QuantumCircuit
 #from quantumcircuit.gate import *
 from qiskit.transpiler.passes.layout import VF2Layout
-from qiskit.transpiler import CouplingMap
 from qiskit import QuantumCircuit as qiskitqc
 from qiskit.converters import circuit_to_dag
+import qiskit
 
-from circuit_slices import get_gates
-
-
-def initial_map(QASMfile:str, chipfile):
-    coupling = []
-    with open(chipfile) as f:
-        lines = f.readlines()
-        for i in range(1,len(lines)):
-            q1,q2 = [int(x) for x in lines[i].strip().split()]
-            coupling.append([q1,q2])
-            coupling.append([q2,q1])
-    coupling_map = CouplingMap(coupling)
-    layout_instance = VF2Layout(coupling_map=coupling_map)
-    qc = QuantumCircuit.from_QASM(QASMfile)
-    dagtable = np.array(qc.to_dagtable())
-    circuit = qiskitqc(qc.get_qubit_number())
-    nowlayer = 0
-    initial_map = [i for i in range(qc.get_qubit_number())]
-    greedy_layout = None
-    while nowlayer<dagtable.shape[1]:
-        _,cnot_gates = get_gates(dagtable[:,nowlayer])
-        if len(cnot_gates) != 0:
-            for gate in cnot_gates:
-                circuit.cz(gate[0], gate[1])
-            layout_instance.run(circuit_to_dag(circuit))
-            result = layout_instance.property_set['VF2Layout_stop_reason']
-            if  result.value == "solution found":
-                greedy_layout = layout_instance.property_set['layout']
-            else:
-                break
-        nowlayer+=1
-    if greedy_layout:
-        for device_q,circuit_q in greedy_layout._v2p.items():
-            initial_map[circuit_q] = device_q._index
-    initial_mapping_str = '['
-    for qubit in initial_map:
-        initial_mapping_str += str(qubit)
-        if qubit == initial_map[-1]:
-            continue
+from circuit_slices import get_layers_gates
+from coupling_graph import load_coupling
+from router_service import get_client
+from compile_cache import compile_key, get_cache
+from compile_result import CompileResult, parse_router_output
+from profiling import span, add, add_external_cpu
+import router
+
+# path of the external router, can be overridden with the EEQM_SCALE environment variable
+EEQM_SCALE = os.environ.get("EEQM_SCALE", "/home/edge/hflash/EEQM_t/cmake-build-debug/EEQM_scale")
+
+
+# VF2 extension steps an embeddability probe spends once a layout is found, see longest_embeddable_prefix
+VF2_PROBE_CALLS = 100
+# seconds the returned layout may spend looking for the best scored one, VF2Layout otherwise
+# enumerates every embedding of sparse graphs (a 5-edge matching on the 4x4 grid takes minutes)
+VF2_TIME_LIMIT = 1.0
+
+
+def vf2_layout(coupling_map, qubit_number, edges, call_limit=None, time_limit=None):
+    """
+    Args:
+        coupling_map: qiskit CouplingMap of the chip
+        qubit_number: qubits of the circuit
+        edges: interaction graph, one CZ is placed per edge
+        call_limit: VF2Layout call_limit, None searches every layout for the best scored one
+        time_limit: VF2Layout time_limit, the best layout found by then is returned
+
+    Returns:
+        the VF2Layout layout, None if the interaction graph can not be embedded
+    """
+    circuit = qiskitqc(qubit_number)
+    for q1, q2 in edges:
+        circuit.cz(q1, q2)
+    layout_instance = VF2Layout(coupling_map=coupling_map, call_limit=call_limit, time_limit=time_limit)
+    layout_instance.run(circuit_to_dag(circuit))
+    if layout_instance.property_set['VF2Layout_stop_reason'].value == "solution found":
+        return layout_instance.property_set['layout']
+    return None
+
+
+def longest_embeddable_prefix(coupling_map, qubit_number, layers_gates):
+    """
+    Layout of the longest prefix of cnot layers whose interaction graph embeds in the chip.
+    Embeddability is monotone in the prefix length, so the prefixes are probed by galloping
+    then bisection instead of one VF2 run per layer. Only layers that add a new interaction
+    edge are candidate ends, and duplicated edges are not sent to VF2.
+
+    Returns:
+        the layout of that prefix, None if even the first cnot layer does not embed
+    """
+    edges = []
+    seen_edges = set()
+    prefix_ends = []
+    for _, cnot_gates in layers_gates:
+        for q1, q2, _ in cnot_gates:
+            if (q1, q2) not in seen_edges:
+                seen_edges.add((q1, q2))
+                edges.append((q1, q2))
+        if len(edges) > 0 and (len(prefix_ends) == 0 or prefix_ends[-1] != len(edges)):
+            prefix_ends.append(len(edges))
+    embeds = {}
+
+    def probe(index):
+        # only whether the prefix embeds: stop shortly after the first layout instead of scoring them all
+        if index not in embeds:
+            embeds[index] = vf2_layout(coupling_map, qubit_number, edges[:prefix_ends[index]],
+                                        (None, VF2_PROBE_CALLS)) is not None
+        return embeds[index]
+
+    # galloping: 0, 1, 3, 7, ... until a prefix fails or the whole circuit embeds
+    found = -1
+    step = 1
+    index = 0
+    while index < len(prefix_ends) and probe(index):
+        found = index
+        index += step
+        step *= 2
+    failed = min(index, len(prefix_ends))
+    # bisection between the last embeddable prefix and the first failed one
+    while failed - found > 1:
+        middle = (found + failed) // 2
+        if probe(middle):
+            found = middle
         else:
-            initial_mapping_str += ','
-    initial_mapping_str += ']'
-    return initial_mapping_str
+            failed = middle
+    if found == -1:
+        return None
+    # the returned layout is the best scored one, as a full VF2Layout run gives, unless that search
+    # outlasts VF2_TIME_LIMIT
+    return vf2_layout(coupling_map, qubit_number, edges[:prefix_ends[found]], time_limit=VF2_TIME_LIMIT)
 
-# compile for SWin+
-def compile(circuit_path, chip_path, result_path):
-    circuit_path = os.path.abspath(circuit_path)
+
+def load_circuit(circuit):
+    """
+    Args:
+        circuit: qasm or binary (.qcb) file path, QuantumCircuit or CircuitView
+
+    Returns:
+        the circuit itself, parsed first if it is a path
+    """
+    if isinstance(circuit, str):
+        if circuit.endswith(".qcb"):
+            return QuantumCircuit.from_binary(circuit)
+        return QuantumCircuit.from_QASM(circuit, lazy_dag=True)
+    return circuit
+
+
+def initial_map(QASMfile, chipfile):
+    coupling = load_coupling(chipfile)
+    qc = load_circuit(QASMfile)
+    dagtable = qc.to_dagtable()
+    # position p holds the logical qubit placed on physical qubit p, ids past the circuit are ancillas
+    initial_map = [-1] * max(qc.get_qubit_number(), coupling.qubit_number)
+    greedy_layout = longest_embeddable_prefix(coupling.coupling_map, qc.get_qubit_number(), get_layers_gates(dagtable))
+    if greedy_layout:
+        for circuit_q, device_q in greedy_layout._v2p.items():
+            initial_map[device_q] = circuit_q._index
+    # qubits the layout leaves out keep the identity order on the free physical qubits
+    unplaced = iter(sorted(set(range(len(initial_map))) - set(initial_map)))
+    initial_map = [next(unplaced) if qubit == -1 else qubit for qubit in initial_map]
+    return '[' + ','.join(str(qubit) for qubit in initial_map) + ']'
+
+_mapping_version = None
+
+
+def mapping_version():
+    """
+    hash of the code initial_map runs and of the qiskit version, part of the compile cache key
+    of results whose mapping initial_map derived
+    """
+    global _mapping_version
+    if _mapping_version is None:
+        digest = hashlib.sha256(qiskit.__version__.encode("utf-8"))
+        for function in (initial_map, longest_embeddable_prefix, vf2_layout, get_layers_gates):
+            digest.update(inspect.getsource(function).encode("utf-8"))
+        _mapping_version = digest.hexdigest()
+    return _mapping_version
+
+def compile_with_worker(circuit_path, chip_path, strategy, initial_mapping_str, worker_command=None):
+    """
+    Route through the resident worker of this process (see router_service) instead of
+    spawning EEQM_scale, the circuit is sent as gate arrays.
+    worker_command: argv of the worker, the pure-Python worker of router_service by default
+    """
+    circuit = load_circuit(circuit_path)
+    start = time.perf_counter()
+    response = get_client(worker_command).route(circuit, chip_path, strategy, initial_mapping_str)
+    # the worker keeps running, so its cpu is not in os.times() of this process
+    add_external_cpu(response.get("cpu_time", 0.0))
+    result = CompileResult.from_dict(response)
+    # round trip to the worker not spent routing
+    result.phase_times["ipc"] = max(time.perf_counter() - start - result.compiler_time, 0.0)
+    result.initial_mapping = initial_mapping_str
+    return result
+
+def compile_builtin(circuit_path, chip_path, strategy, initial_mapping_str):
+    """
+    Route in this process with the built-in NumPy router (see router.py), no external binary needed.
+    strategy: nogreedy or greedy, see router.STRATEGIES
+    """
+    circuit = load_circuit(circuit_path)
+    return CompileResult.from_dict(router.route(circuit, chip_path, initial_mapping_str, strategy=strategy),
+                                   initial_mapping_str)
+
+def route_circuit(circuit, qasm_path, chip_path, result_path, strategy, initial_mapping_str, backend):
+    """
+    Route one circuit with the given backend, no caching.
+    qasm_path: file of the circuit if it has one, EEQM_scale reads it instead of a scratch copy
+    """
+    if backend == "worker":
+        return compile_with_worker(circuit, chip_path, strategy, initial_mapping_str)
+    if backend == "builtin":
+        return compile_builtin(circuit, chip_path, strategy, initial_mapping_str)
+    if qasm_path is not None and result_path is not None:
+        return run_eeqm_scale(qasm_path, chip_path, os.path.abspath(result_path), strategy, initial_mapping_str)
+    # EEQM_scale only reads files, in-memory circuits go through a scratch directory
+    with tempfile.TemporaryDirectory() as scratch:
+        if qasm_path is None:
+            qasm_path = os.path.join(scratch, "circuit.qasm")
+            with span("qasm_write"):
+                circuit.to_QASM(qasm_path)
+        if result_path is None:
+            result_path = os.path.join(scratch, "result")
+        return run_eeqm_scale(qasm_path, chip_path, os.path.abspath(result_path), strategy, initial_mapping_str)
+
+def cached_compile(circuit_path, chip_path, result_path, strategy, initial_mapping_str, backend, use_cache):
+    """
+    Look the circuit up in the compile cache (see compile_cache) before routing it.
+    initial_mapping_str: None to derive it with initial_map, the key then records "vf2" and mapping_version()
+    result_path: the cache only holds the parsed result, not the file EEQM_scale writes,
+                 so a compile asked for a result file is always routed (and its result stored)
+    """
     chip_path = os.path.abspath(chip_path)
-    result_path = os.path.abspath(result_path)
-    cpp_program = "/home/edge/hflash/EEQM_t/cmake-build-debug/EEQM_scale"
-    initial_mapping_str = initial_map(circuit_path, chip_path)
-
-    result = subprocess.run([cpp_program, circuit_path, chip_path, result_path, "nogreedy", initial_mapping_str], capture_output=True, text=True)
-    output = result.stdout
-
-    if output:
-        compiler_time = None
-        compiler_depth = None
-        lines = output.split('\n')
-        for i in range(len(lines)):
-            if "time = " in lines[i]:
-                match = re.search(r'\d+\.\d+', lines[i])
-                compiler_time = float(match.group())
-            elif "cnot number = " in lines[i]:
-                match = re.search(r'\d+', lines[i])
-                extra_cnot_cnt = int(match.group())
-            elif "depth = " in lines[i]:
-                match = re.search(r'\d+', lines[i])
-                compiler_depth = int(match.group())
-        compile_result = {
-            "compiler_time": compiler_time,
-            "initial_mapping": initial_mapping_str,
-            "compiler_depth": compiler_depth,
-            "swap_count": int(extra_cnot_cnt/3),
-        }
-    else:
-        print([circuit_path, chip_path, result_path, initial_mapping_str])
+    with span("parse"):
+        circuit = load_circuit(circuit_path)
+    qasm_path = None
+    if isinstance(circuit_path, str) and not circuit_path.endswith(".qcb"):
+        qasm_path = os.path.abspath(circuit_path)
+    key = None
+    record = None
+    if use_cache:
+        with span("cache"):
+            key = compile_key(circuit, chip_path, strategy, initial_mapping_str, backend, EEQM_SCALE,
+                              mapping_version())
+            if key is not None and result_path is None:
+                record = get_cache().get(key)
+        if record is not None:
+            return CompileResult.from_dict(record)
+    if initial_mapping_str is None:
+        with span("initial_map"):
+            initial_mapping_str = initial_map(circuit, chip_path)
+    with span("route"):
+        compile_result = route_circuit(circuit, qasm_path, chip_path, result_path, strategy, initial_mapping_str,
+                                       backend)
+    # time the router reports for itself, route minus router is process start, I/O and IPC
+    add("router", compile_result.compiler_time)
+    if key is not None:
+        with span("cache"):
+            get_cache().put(key, compile_result.to_dict())
     return compile_result
 
-# compile for SWin
-def compile_without_slice(circuit_path, chip_path, result_path, strategy, initial_mapping_str):
-    circuit_path = os.path.abspath(circuit_path)
-    chip_path = os.path.abspath(chip_path)
-    result_path = os.path.abspath(result_path)
-    cpp_program = "/home/edge/hflash/EEQM_t/cmake-build-debug/EEQM_scale"
-    initial_mapping_str = initial_mapping_str
-
-    result = subprocess.run([cpp_program, circuit_path, chip_path, result_path, strategy, initial_mapping_str],
-                            capture_output=True, text=True)
-    output = result.stdout
-
-    if output:
-        compiler_time = None
-        compiler_depth = None
-        lines = output.split('\n')
-        for i in range(len(lines)):
-            if "time = " in lines[i]:
-                match = re.search(r'\d+\.\d+', lines[i])
-                compiler_time = float(match.group())
-            elif "cnot number = " in lines[i]:
-                match = re.search(r'\d+', lines[i])
-                extra_cnot_cnt = int(match.group())
-            elif "depth = " in lines[i]:
-                match = re.search(r'\d+', lines[i])
-                compiler_depth = int(match.group())
-        compile_result = {
-            "compiler_time": compiler_time,
-            "initial_mapping": initial_mapping_str,
-            "compiler_depth": compiler_depth,
-            "swap_count": int(extra_cnot_cnt / 3),
-        }
-    else:
-        print([circuit_path, chip_path, result_path, initial_mapping_str])
+# compile for SWin+
+def compile(circuit_path, chip_path, result_path=None, backend="EEQM_scale", use_cache=False):
+    """
+    Args:
+        circuit_path: qasm file, or an in-memory QuantumCircuit / CircuitView
+        result_path: output of EEQM_scale, a temporary file if None
+        use_cache: return the stored result of an identical earlier compile if there is one,
+                   never done when result_path is given. Off by default: with a VF2 mapping
+                   (randomly seeded) a stored result is one sample, not what a new run gives
+
+    Returns:
+        CompileResult
+    """
+    return cached_compile(circuit_path, chip_path, result_path, "nogreedy", None, backend, use_cache)
+
+def run_eeqm_scale(circuit_path, chip_path, result_path, strategy, initial_mapping_str):
+    """
+    Run the EEQM_scale binary on a qasm file and parse its report, see compile_result.parse_router_output
+
+    Returns:
+        CompileResult
+    """
+    cpp_program = EEQM_SCALE
+    command = [cpp_program, circuit_path, chip_path, result_path, strategy, initial_mapping_str]
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    try:
+        compile_result = parse_router_output(result.stdout, initial_mapping_str)
+    except ValueError as e:
+        raise RuntimeError("EEQM_scale gave no result ({}, exit code {}): {}\n{}".format(
+            e, result.returncode, command, result.stderr.strip()))
+    # process start, qasm parsing and writing the result file
+    compile_result.phase_times.setdefault("process", max(elapsed - compile_result.compiler_time, 0.0))
     return compile_result
 
+# compile for SWin
+def compile_without_slice(circuit_path, chip_path, result_path, strategy, initial_mapping_str, backend="EEQM_scale",
+                          use_cache=False):
+    return cached_compile(circuit_path, chip_path, result_path, strategy, initial_mapping_str, backend, use_cache)
+
 
 # batch test SWin for small-scale circuits
+# (benchmark_suite.py runs every benchmark circuit, chip and strategy in parallel and resumably)
 # the window size are set as 8 in main func of C++ project
 def batch_compile_circuit_small():
     circuit_path_all_small = '/home/edge/fzchen/swin_src/qasm-benchmark/cr_iccad_circuits/small'
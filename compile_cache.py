@@ -0,0 +1,161 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : compile_cache.py
+# @IDE     : PyCharm
+"""
+Content-addressed cache of compile results.
+
+A result is keyed by the gates of the circuit, the coupling file contents, the routing
+strategy, the initial mapping and the backend, so identical slices cut from different
+places (periodic layers, overlapping windows, reruns of a benchmark) are routed once.
+Entries live in an in-memory LRU and, unless disabled, one JSON file per key on disk.
+"""
+import os
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from coupling_graph import load_coupling
+
+# on-disk location, can be overridden with the EEQM_CACHE environment variable, "" keeps the cache in memory only
+EEQM_CACHE = os.environ.get("EEQM_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "eeqm"))
+
+
+def circuit_digest(circuit):
+    """
+    Args:
+        circuit: QuantumCircuit or CircuitView
+
+    Returns:
+        sha256 of the gates in canonical order (by dagtable layer then first qubit),
+        so the order commuting gates were added in does not matter;
+        None for circuits with gates that have no array form (symbolic parameters)
+    """
+    try:
+        opcode, qubit0, qubit1, para = circuit.get_gate_columns()
+    except ValueError:
+        return None
+    layers = circuit.get_gate_layers()[1:]
+    order = np.lexsort((qubit0, layers))
+    digest = hashlib.sha256()
+    digest.update(np.int64(circuit.get_qubit_number()).tobytes())
+    for column, dtype in ((opcode, np.int8), (qubit0, np.int32), (qubit1, np.int32), (para, np.float64)):
+        digest.update(np.ascontiguousarray(column[order], dtype=dtype).tobytes())
+    return digest.hexdigest()
+
+
+def backend_version(backend, router_binary=None):
+    """
+    changes whenever the router behind backend is rebuilt or edited, so stale results are not reused
+    """
+    if backend in ("worker", "builtin"):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "router.py")
+    else:
+        path = router_binary
+    if path and os.path.exists(path):
+        return os.stat(path).st_mtime_ns
+    return None
+
+
+def compile_key(circuit, chip_path, strategy, initial_mapping, backend, router_binary=None, mapping_version=None):
+    """
+    Args:
+        initial_mapping: mapping string, None when compile derives it with VF2 itself
+        mapping_version: identifies the code deriving the mapping when initial_mapping is None,
+                         so editing it does not serve results routed from the old mappings
+
+    Returns:
+        hex key of the compile result, None if the circuit can not be hashed
+    """
+    gates = circuit_digest(circuit)
+    if gates is None:
+        return None
+    fields = [gates, load_coupling(chip_path).digest, strategy,
+              "vf2:%s" % mapping_version if initial_mapping is None else str(initial_mapping).replace(" ", ""),
+              backend, backend_version(backend, router_binary)]
+    return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+class CompileCache:
+    """
+    LRU of compile results in memory, backed by directory/<key[:2]>/<key>.json
+    """
+
+    def __init__(self, directory=EEQM_CACHE, capacity=4096):
+        """
+        Args:
+            directory: on-disk store, memory only if empty or None
+            capacity: entries kept in memory
+        """
+        self.directory = directory or None
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        Returns:
+            the stored compile result, None on a miss
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(self.entries[key])
+        if self.directory is not None:
+            try:
+                with open(self._path(key)) as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = None
+            if result is not None:
+                self._remember(key, result)
+                self.hits += 1
+                return dict(result)
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        self._remember(key, dict(result))
+        if self.directory is not None:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write then rename, concurrent pool workers never see half a file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+
+    def _remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    the CompileCache of this process, created on first use
+    """
+    global _cache
+    if _cache is None:
+        _cache = CompileCache()
+    return _cache
@@ -0,0 +1,123 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : compile_result.py
+# @IDE     : PyCharm
+"""
+Result of routing one circuit, shared by every backend of compile().
+
+Routers report a JSON record
+    {"compiler_time", "compiler_depth", "swap_count", "final_mapping": [...], "phase_times": {phase: seconds}}
+which is parsed into a CompileResult. EEQM_scale builds that only print the
+"time = / cnot number = / depth = " lines are still read through parse_router_output.
+"""
+import re
+import json
+
+
+class CompileResult:
+    """
+    compiler_time: seconds spent routing, as measured by the router
+    compiler_depth: depth of the routed circuit, a SWAP counts as 3 CNOTs
+    swap_count: SWAPs inserted
+    initial_mapping: mapping string the router started from
+    final_mapping: physical qubit of every logical qubit at the end, None if the router does not report it
+    phase_times: {phase: seconds} reported by the router and the backend, e.g. placement, routing, ipc
+
+    Reads like the dict compile() used to return, result["compiler_depth"] and dict(result) still work.
+    """
+    fields = ("compiler_time", "initial_mapping", "compiler_depth", "swap_count", "final_mapping", "phase_times")
+
+    def __init__(self, compiler_time, compiler_depth, swap_count, initial_mapping=None, final_mapping=None,
+                 phase_times=None):
+        self.compiler_time = float(compiler_time)
+        self.compiler_depth = int(compiler_depth)
+        self.swap_count = int(swap_count)
+        self.initial_mapping = initial_mapping
+        self.final_mapping = None if final_mapping is None else [int(qubit) for qubit in final_mapping]
+        self.phase_times = dict(phase_times or {})
+
+    @classmethod
+    def from_dict(cls, record, initial_mapping=None):
+        """
+        Args:
+            record: router record or to_dict() output, compiler_time, compiler_depth and swap_count are required
+            initial_mapping: used when record has none
+
+        Returns:
+            CompileResult
+        """
+        missing = [field for field in ("compiler_time", "compiler_depth", "swap_count") if record.get(field) is None]
+        if missing:
+            raise ValueError("compile result misses " + ", ".join(missing))
+        return cls(record["compiler_time"], record["compiler_depth"], record["swap_count"],
+                   record.get("initial_mapping", initial_mapping), record.get("final_mapping"),
+                   record.get("phase_times"))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+    def keys(self):
+        return self.fields
+
+    def __getitem__(self, field):
+        if field not in self.fields:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self.fields else default
+
+    def __eq__(self, other):
+        if not isinstance(other, CompileResult):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "CompileResult(depth=%d, swaps=%d, time=%.6f)" % (self.compiler_depth, self.swap_count,
+                                                                  self.compiler_time)
+
+
+def parse_router_output(output, initial_mapping=None):
+    """
+    Args:
+        output: stdout of the router
+        initial_mapping: mapping string the router was started with
+
+    Returns:
+        CompileResult of the last JSON record line of output, or of the legacy text lines if there is none
+
+    Raises:
+        ValueError: output is empty or lacks time, depth or cnot number
+    """
+    lines = output.splitlines()
+    for line in reversed(lines):
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            return CompileResult.from_dict(record, initial_mapping)
+    record = {}
+    for line in lines:
+        if "time = " in line:
+            match = re.search(r'\d+(\.\d+)?', line)
+            record["compiler_time"] = float(match.group()) if match else None
+        elif "cnot number = " in line:
+            match = re.search(r'\d+', line)
+            record["swap_count"] = int(match.group()) // 3 if match else None
+        elif "depth = " in line:
+            match = re.search(r'\d+', line)
+            record["compiler_depth"] = int(match.group()) if match else None
+    return CompileResult.from_dict(record, initial_mapping)
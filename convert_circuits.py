@@ -0,0 +1,99 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : convert_circuits.py
+# @IDE     : PyCharm
+"""
+Convert circuits between OpenQASM and the binary format of quantumcircuit.binary (.qcb).
+A directory is converted file by file into the same layout under the output directory,
+files that can not be converted are reported and skipped.
+
+usage: python convert_circuits.py qasm2bin <qasm file or directory> <output directory> [nodag]
+       python convert_circuits.py bin2qasm <qcb file or directory> <output directory>
+"""
+import os
+import sys
+from quantumcircuit import QuantumCircuit
+
+EXTENSIONS = {"qasm2bin": (".qasm", ".qcb"), "bin2qasm": (".qcb", ".qasm")}
+
+
+def find_files(source, extension):
+    """
+    Returns:
+        [(file, path relative to source)], a file source is returned alone
+    """
+    if os.path.isfile(source):
+        return [(source, os.path.basename(source))]
+    files = []
+    for root, dirs, names in os.walk(source):
+        for name in sorted(names):
+            if name.endswith(extension):
+                path = os.path.join(root, name)
+                files.append((path, os.path.relpath(path, source)))
+    return files
+
+
+def convert_file(mode, source_file, target_file, dagtable=True):
+    """
+    Returns:
+        None on success, the reason of the failure otherwise
+    """
+    if mode == "qasm2bin":
+        circuit = QuantumCircuit.from_QASM(source_file, compact=True, lazy_dag=True)
+        if circuit is None:
+            return "not parsable"
+        try:
+            circuit.to_binary(target_file, dagtable)
+        except ValueError as e:
+            return str(e)
+    else:
+        try:
+            circuit = QuantumCircuit.from_binary(source_file)
+        except ValueError as e:
+            return str(e)
+        circuit.to_QASM(target_file)
+    return None
+
+
+def convert(mode, source, target_dir, dagtable=True):
+    """
+    Args:
+        mode: qasm2bin or bin2qasm
+        dagtable: store the dagtable in binary files
+
+    Returns:
+        (converted, {file: reason} of the skipped ones)
+    """
+    source_extension, target_extension = EXTENSIONS[mode]
+    converted = 0
+    skipped = {}
+    for source_file, relative in find_files(source, source_extension):
+        target_file = os.path.join(target_dir, os.path.splitext(relative)[0] + target_extension)
+        os.makedirs(os.path.dirname(target_file), exist_ok=True)
+        reason = convert_file(mode, source_file, target_file, dagtable)
+        if reason is None:
+            converted += 1
+        else:
+            skipped[source_file] = reason
+    return converted, skipped
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in EXTENSIONS:
+        print(__doc__.strip().split("usage:")[-1])
+        exit(1)
+    converted, skipped = convert(sys.argv[1], sys.argv[2], sys.argv[3], "nodag" not in sys.argv[4:])
+    for source_file, reason in skipped.items():
+        print("skipped {}: {}".format(source_file, reason))
+    print("converted: {} skipped: {}".format(converted, len(skipped)))
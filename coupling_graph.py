@@ -0,0 +1,120 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : coupling_graph.py
+# @IDE     : PyCharm
+import os
+import hashlib
+from collections import deque
+import numpy as np
+
+
+class CouplingGraph:
+    """
+    A chip loaded once: adjacency matrix, neighbor lists, all-pairs distances
+    and the qiskit CouplingMap built from the same edges.
+    Pickling only carries the NumPy arrays, the CouplingMap is rebuilt on demand.
+    """
+
+    def __init__(self, qubit_number, edges, path=None, mtime_ns=None, digest=None):
+        self.qubit_number = qubit_number
+        self.path = path
+        self.mtime_ns = mtime_ns
+        # sha256 of the coupling file, identifies the chip in compile cache keys
+        self.digest = digest
+        self.edges = np.array(edges, dtype=np.int32).reshape(-1, 2)
+        self.adjacency = np.zeros((qubit_number, qubit_number), dtype=bool)
+        self.adjacency[self.edges[:, 0], self.edges[:, 1]] = True
+        self.adjacency[self.edges[:, 1], self.edges[:, 0]] = True
+        self.neighbors = [np.flatnonzero(row).tolist() for row in self.adjacency]
+        self.distance = self._bfs_distances()
+        self._coupling_map = None
+
+    @classmethod
+    def from_file(cls, chip_path):
+        """
+        coupling file: "qubits edges" on the first line then one "q1 q2" per line
+        """
+        with open(chip_path, 'rb') as f:
+            content = f.read()
+        lines = content.decode().splitlines()
+        qubit_number = int(lines[0].split()[0])
+        edges = []
+        for line in lines[1:]:
+            if line.strip():
+                q1, q2 = [int(x) for x in line.split()]
+                edges.append((q1, q2))
+        path = os.path.abspath(chip_path)
+        return cls(qubit_number, edges, path, os.stat(path).st_mtime_ns, hashlib.sha256(content).hexdigest())
+
+    def _bfs_distances(self):
+        """
+        shortest path lengths by BFS from every qubit, unreachable pairs are qubit_number
+        """
+        n = self.qubit_number
+        distance = np.full((n, n), n, dtype=np.int32)
+        for source in range(n):
+            distance[source, source] = 0
+            queue = deque([source])
+            while queue:
+                node = queue.popleft()
+                for neighbor in self.neighbors[node]:
+                    if distance[source, neighbor] == n and neighbor != source:
+                        distance[source, neighbor] = distance[source, node] + 1
+                        queue.append(neighbor)
+        return distance
+
+    @property
+    def coupling_map(self):
+        """
+        qiskit CouplingMap with both directions of every edge, built once
+        """
+        if self._coupling_map is None:
+            from qiskit.transpiler import CouplingMap
+            coupling = []
+            for q1, q2 in self.edges.tolist():
+                coupling.append([q1, q2])
+                coupling.append([q2, q1])
+            self._coupling_map = CouplingMap(coupling)
+        return self._coupling_map
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_coupling_map"] = None
+        return state
+
+
+_graphs = {}
+
+
+def load_coupling(chip_path):
+    """
+    CouplingGraph of a coupling file, memoized by path and modification time
+    """
+    path = os.path.abspath(chip_path)
+    key = (path, os.stat(path).st_mtime_ns)
+    if key not in _graphs:
+        for stale in [k for k in _graphs if k[0] == path]:
+            del _graphs[stale]
+        graph = CouplingGraph.from_file(path)
+        _graphs[(path, graph.mtime_ns)] = graph
+        key = (path, graph.mtime_ns)
+    return _graphs[key]
+
+
+def register_coupling(graph):
+    """
+    seed the memo of this process with an already loaded graph,
+    used as Pool initializer so workers receive the chip once
+    """
+    _graphs[(graph.path, graph.mtime_ns)] = graph
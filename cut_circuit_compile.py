@@ -1,133 +1,494 @@
 import os
 import sys
+import time
 import random
 import numpy as np
 from compile import compile
-from circuit_slices import cut_circuit, get_gates
+from coupling_graph import load_coupling, register_coupling
+from parallel import default_workers
+from circuit_slices import LayerIndex, sweep_slices, write_slices
 from quantumcircuit import QuantumCircuit
+import profiling
+from profiling import span
 from matplotlib import pyplot as plt
-from multiprocessing import Pool, pool
-
-
-def depth_sample(circuit, depth, startlayer):
-    dagtable = np.array(circuit.to_dagtable())
-    circuit_slice = QuantumCircuit(qubit_number=dagtable.shape[0])
-    layer_numbers = dagtable.shape[1]
-    now_depth = 0
-    while startlayer < layer_numbers and now_depth < depth:
-        gate_time = set(dagtable[:, startlayer])
-        for gate_id in gate_time:
-            if gate_id == -1:
-                continue
-            gate = circuit.gate_list[gate_id]
-            circuit_slice.add_gate(gate)
-        startlayer += 1
-        now_depth += 1
-    if now_depth == depth:
-        return circuit_slice
-    else:
-        return None
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 
-def gate_sample(circuit, average_gate_cnt, startlayer):
-    dagtable = np.array(circuit.to_dagtable())
-    circuit_slice = QuantumCircuit(qubit_number=dagtable.shape[0])
-    layer_numbers = dagtable.shape[1]
-    tmp_gate_numbers = 0
-    single_gates = []
-    cnot_gates = []
-    while tmp_gate_numbers < average_gate_cnt:
-        if len(cnot_gates) != 0:
-            gate = circuit.gate_list[cnot_gates.pop()[-1]]
-            circuit_slice.add_gate(gate)
-            tmp_gate_numbers += 2
-        elif len(single_gates) != 0:
-            gate = circuit.gate_list[single_gates.pop()[-1]]
-            circuit_slice.add_gate(gate)
-            tmp_gate_numbers += 1
-        else:
-            if startlayer < layer_numbers:
-                single_gates, cnot_gates = get_gates(dagtable[:, startlayer])
-                startlayer += 1
-            else:
-                break
-    if tmp_gate_numbers >= average_gate_cnt:
-        return circuit_slice
-    else:
-        return None
+def depth_sample(layer_index, depth, startlayer):
+    return layer_index.depth_window(startlayer, depth)
 
 
-def sample(circuit_path, slice_number, method, arg, write_path):
-    circuit = QuantumCircuit.from_QASM(circuit_path)
+def gate_sample(layer_index, average_gate_cnt, startlayer):
+    return layer_index.gate_window(startlayer, average_gate_cnt)
+
+
+def sample_slices(circuit, slice_number, method, arg, layer_index=None):
+    """
+    Args:
+        layer_index: LayerIndex of circuit, built here if None
+
+    Returns:
+        list of slice_number CircuitView windows starting at random layers of circuit,
+        start layers are drawn among those whose window fits in the circuit
+    """
+    if layer_index is None:
+        layer_index = LayerIndex(circuit)
     if method == 'depth':
         sample_func = depth_sample
+        last_start = layer_index.last_depth_start(arg)
     elif method == 'gatecnt':
         sample_func = gate_sample
+        last_start = layer_index.last_weight_start(arg)
     else:
         print('unknow sample method:', method)
         exit(0)
-    write_file_path = os.path.join(write_path, method + 'sample')
-    if not os.path.exists(write_file_path):
-        os.makedirs(write_file_path)
-    has_get_circuit_number = 0
-    files_list = []
-    while has_get_circuit_number < slice_number:
-        startlayer = random.randint(0, circuit.get_circuit_depth() - 1)
-        circuit_slice = sample_func(circuit, arg, startlayer)
-        if circuit_slice is not None:
-            slice_filename = os.path.join(write_file_path, 'slice_' + str(has_get_circuit_number) + '.qasm')
-            circuit_slice.to_QASM(slice_filename)
-            files_list.append(slice_filename)
-            has_get_circuit_number += 1
-    return files_list
+    if last_start < 0:
+        raise ValueError("no {} window of {} fits in the circuit".format(method, arg))
+    circuit_slices = []
+    for _ in range(slice_number):
+        startlayer = random.randint(0, last_start)
+        circuit_slices.append(sample_func(layer_index, arg, startlayer))
+    return circuit_slices
+
+
+def sample(circuit_path, slice_number, method, arg, write_path):
+    circuit = QuantumCircuit.from_QASM(circuit_path, lazy_dag=True)
+    circuit_slices = sample_slices(circuit, slice_number, method, arg)
+    return write_slices(circuit_slices, os.path.join(write_path, method + 'sample'))
 
 
 class Slice_info:
-    def __init__(self, circuit_slices, method, arg):
+    def __init__(self, circuit_slices, method, arg, result_dir=None):
+        """
+        circuit_slices: qasm files or in-memory CircuitView slices,
+        result_dir: where EEQM_scale writes its results, next to the qasm files by default,
+                    results of in-memory slices are not kept if None
+        """
         self.circuit_slices = circuit_slices
-        self.result_dir = os.path.join(os.path.dirname(circuit_slices[0]), 'result')
+        if result_dir is None and isinstance(circuit_slices[0], str):
+            result_dir = os.path.join(os.path.dirname(circuit_slices[0]), 'result')
+        self.result_dir = result_dir
         # if not os.path.exists(self.result_dir):
         #    os.mkdir(self.result_dir)
         self.method = method
         self.arg = arg
-        self.processes: list[pool.ApplyResult] = []
         self.data = []
+        # True when compiling stopped at the first slice deeper than the device, data is then partial
+        self.stopped = False
+        # time.perf_counter() when its last slice came back, cpu seconds of its slices
+        self.ready_at = None
+        self.cpu_time = None
 
     def get_circuit_slices(self):
         return self.circuit_slices
 
-    def set_processes(self, processes: list[pool.ApplyResult]):
-        self.processes = processes
+    def set_data(self, data, stopped=False):
+        self.data = data
+        self.stopped = stopped
+
+    def set_timing(self, ready_at, cpu_time):
+        self.ready_at = ready_at
+        self.cpu_time = cpu_time
 
     def get_data(self):
-        if len(self.data) == 0:
-            for p in self.processes:
-                result = p.get()
-                self.data.append([result["compiler_time"], result["compiler_depth"]])
         return self.data
 
     def get_slice_number(self):
         return len(self.circuit_slices)
 
-    def draw(self):
+    def draw(self, write_path=None):
+        """
+        write_path: directory of time.png and depth.png, next to result_dir if None,
+                    nothing is drawn when the slices have neither
+        """
+        if write_path is None:
+            if self.result_dir is None:
+                print('no directory to draw slice info in')
+                return
+            write_path = os.path.dirname(self.result_dir)
         data = np.array(self.get_data())
         x = [str(i) for i in range(len(self.circuit_slices))]
         plt.clf()
         plt.bar(x, data[:, 0])
-        plt.savefig(os.path.join(os.path.dirname(self.circuit_slices[0]), 'time.png'))
+        plt.savefig(os.path.join(write_path, 'time.png'))
         plt.clf()
         plt.bar(x, data[:, 1])
-        plt.savefig(os.path.join(os.path.dirname(self.circuit_slices[0]), 'depth.png'))
+        plt.savefig(os.path.join(write_path, 'depth.png'))
+
 
+def make_slice_info(circuit_slices, method, arg, archive_path=None, prefix=''):
+    """
+    archive_path: if set, the slices are also written there as qasm files
+                  and EEQM_scale results are kept in archive_path/result
+    """
+    result_dir = None
+    if archive_path is not None:
+        with span("archive"):
+            write_slices(circuit_slices, archive_path, prefix)
+        result_dir = os.path.join(archive_path, 'result')
+    return Slice_info(circuit_slices, method, arg, result_dir)
 
-def run_parallel(slice_infoes: list[Slice_info], coupling_file):
-    p = Pool(processes=64)
-    for slice_info in slice_infoes:
-        slice_info.set_processes([p.apply_async(compile, (
-        item, coupling_file, os.path.join(slice_info.result_dir, os.path.basename(item)[:-5])))
-                                  for item in slice_info.get_circuit_slices()])
-    p.close()
-    p.join()
+
+def slice_result_path(result_dir, circuit_slice, index):
+    if result_dir is None:
+        return None
+    if isinstance(circuit_slice, str):
+        return os.path.join(result_dir, os.path.basename(circuit_slice)[:-5])
+    return os.path.join(result_dir, 'slice_' + str(index))
+
+
+def slice_key(circuit_slice):
+    """
+    identity of a slice for deduplication: the path of a file, the object of a CircuitView
+    (LayerIndex hands out one object per distinct slice), ids are only unique while the view
+    is alive, so SliceScheduler keeps every slice it was given
+    """
+    return circuit_slice if isinstance(circuit_slice, str) else id(circuit_slice)
+
+
+def slice_cost(circuit_slice):
+    """
+    estimated routing cost of a slice: gate count of a CircuitView, line count of a qasm file
+    """
+    if isinstance(circuit_slice, str):
+        with open(circuit_slice) as f:
+            return sum(1 for _ in f)
+    return len(circuit_slice)
+
+
+def init_worker(coupling):
+    register_coupling(coupling)
+    profiling.reset()
+
+
+def compile_task(circuit_slices, coupling_file, result_paths, backend, submitted, use_cache=False):
+    """
+    pool task, compiles a chunk of slices one after the other
+
+    Args:
+        submitted: time.time() when the task was submitted, the wait is recorded as the "queue" span
+        use_cache: see compile.compile
+
+    Returns:
+        (worker pid, [(wall seconds, cpu seconds) of each slice], compile results, profiling.collect() of the task)
+    """
+    profiling.add("queue", max(time.time() - submitted, 0.0))
+    times = []
+    results = []
+    for item, result_path in zip(circuit_slices, result_paths):
+        start = time.perf_counter()
+        start_cpu = profiling.cpu_time()
+        results.append(compile(item, coupling_file, result_path, backend, use_cache))
+        times.append((time.perf_counter() - start, profiling.cpu_time() - start_cpu))
+    return os.getpid(), times, results, profiling.collect()
+
+
+class SliceScheduler:
+    """
+    Compiles slices in a process pool, each distinct slice once.
+    Results and tasks still in flight are shared between all the Slice_info run through it,
+    so a slice compiled for one candidate (or phase) is reused by the next ones.
+    Slices are submitted longest first (gate count as cost), and slices under chunk_gates gates
+    are sent chunk_size at a time to save the per-task overhead.
+    """
+    chunk_gates = 64
+    chunk_size = 16
+
+    def __init__(self, coupling_file, backend="EEQM_scale", max_workers=None, use_cache=False):
+        """
+        Args:
+            max_workers: pool size, the cores available to this process if None
+            use_cache: look slices up in the compile cache, see compile.compile
+        """
+        if max_workers is None:
+            max_workers = default_workers()
+        self.coupling_file = coupling_file
+        self.backend = backend
+        self.use_cache = use_cache
+        self.max_workers = max_workers
+        # the chip is loaded once here and handed to every worker when it starts
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                            initargs=(load_coupling(coupling_file),))
+        self.results = {}
+        # slice key -> the slice, keeps views alive so their id is not reused by another view
+        self.slices = {}
+        # slice key -> future of the task compiling it, future -> keys of its slices
+        self.in_flight = {}
+        self.task_keys = {}
+        self.submitted = 0
+        self.cancelled = 0
+        # worker pid -> [tasks, busy seconds, cpu seconds]
+        self.worker_busy = {}
+        # slice key -> (wall seconds, cpu seconds, perf_counter() when its result came back)
+        self.slice_times = {}
+        self.cpu_time = 0.0
+        self.start_time = None
+        self.end_time = None
+
+    def compiled(self):
+        """
+        number of slices sent to the pool and not cancelled
+        """
+        return self.submitted - self.cancelled
+
+    def _submit_task(self, entries):
+        future = self.executor.submit(compile_task, [item for _, item, _ in entries], self.coupling_file,
+                                      [result_path for _, _, result_path in entries], self.backend, time.time(),
+                                      self.use_cache)
+        keys = [key for key, _, _ in entries]
+        for key, item, _ in entries:
+            self.in_flight[key] = future
+            self.slices[key] = item
+        self.task_keys[future] = keys
+        self.submitted += len(keys)
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+
+    def _submit(self, entries):
+        """
+        entries: (key, slice, result path, cost) in submission order, small slices next to each other are chunked
+        """
+        chunk = []
+        for key, item, result_path, cost in entries:
+            if cost >= self.chunk_gates:
+                self._submit_task([(key, item, result_path)])
+                continue
+            chunk.append((key, item, result_path))
+            if len(chunk) == self.chunk_size:
+                self._submit_task(chunk)
+                chunk = []
+        if chunk:
+            self._submit_task(chunk)
+
+    def _collect(self, future):
+        pid, times, results, spans = future.result()
+        profiling.merge(spans)
+        worker = self.worker_busy.setdefault(pid, [0, 0.0, 0.0])
+        worker[0] += 1
+        worker[1] += sum(wall for wall, _ in times)
+        worker[2] += sum(cpu for _, cpu in times)
+        self.cpu_time += sum(cpu for _, cpu in times)
+        self.end_time = time.perf_counter()
+        keys = self.task_keys.pop(future)
+        for key, result, (wall, cpu) in zip(keys, results, times):
+            self.results[key] = result
+            self.slice_times[key] = (wall, cpu, self.end_time)
+            self.in_flight.pop(key, None)
+        return keys
+
+    def run(self, slice_info, device_depth=None):
+        """
+        Compile the slices of slice_info, see run_groups
+
+        Returns:
+            True if every slice was compiled and none is deeper than device_depth
+        """
+        return self.run_groups([slice_info], device_depth)[0]
+
+    def run_groups(self, slice_infos, device_depth=None, prioritized=False):
+        """
+        Compile the slices of several Slice_info at once and store their data and timing in them.
+        Results are consumed as they complete. With device_depth, a group stops at its first
+        slice deeper than device_depth, and the tasks that have not started and that no other
+        running group needs are cancelled.
+
+        Args:
+            prioritized: slice_infos are sorted by priority, submit them group after group
+                         (longest slice first inside a group) instead of longest first overall
+
+        Returns:
+            list, for each group True if every slice was compiled and none is deeper than device_depth
+        """
+        start = time.perf_counter()
+        group_keys = [[slice_key(item) for item in info.get_circuit_slices()] for info in slice_infos]
+        failed = [False] * len(slice_infos)
+        # slices still to come -> groups waiting for them
+        users = {}
+        entries = []
+
+        def violated(key):
+            return device_depth is not None and self.results[key].compiler_depth > device_depth
+
+        for group, info in enumerate(slice_infos):
+            if any(violated(key) for key in group_keys[group] if key in self.results):
+                failed[group] = True
+                continue
+            for i, item in enumerate(info.get_circuit_slices()):
+                key = group_keys[group][i]
+                if key in self.results:
+                    continue
+                if key not in users and key not in self.in_flight:
+                    entries.append((group, key, item, slice_result_path(info.result_dir, item, i), slice_cost(item)))
+                users.setdefault(key, set()).add(group)
+        if prioritized:
+            entries.sort(key=lambda entry: (entry[0], -entry[4]))
+        else:
+            entries.sort(key=lambda entry: -entry[4])
+        self._submit([entry[1:] for entry in entries])
+        waiting = {self.in_flight[key] for key in users}
+
+        def drop(group):
+            failed[group] = True
+            for key in group_keys[group]:
+                if key in users:
+                    users[key].discard(group)
+                    if not users[key]:
+                        del users[key]
+            for future in list(waiting):
+                keys = self.task_keys[future]
+                if not any(key in users for key in keys) and future.cancel():
+                    waiting.discard(future)
+                    del self.task_keys[future]
+                    for key in keys:
+                        del self.in_flight[key]
+                    self.cancelled += len(keys)
+
+        while waiting:
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future not in waiting:
+                    continue
+                waiting.discard(future)
+                for key in self._collect(future):
+                    groups = users.pop(key, set())
+                    if violated(key):
+                        for group in groups:
+                            drop(group)
+        fits = []
+        for group, info in enumerate(slice_infos):
+            done_keys = [key for key in group_keys[group] if key in self.results]
+            info.set_data([[self.results[key].compiler_time, self.results[key].compiler_depth]
+                           for key in done_keys], stopped=len(done_keys) < len(group_keys[group]))
+            info.set_timing(max((self.slice_times[key][2] for key in done_keys), default=start),
+                            sum(self.slice_times[key][1] for key in done_keys))
+            fits.append(not failed[group] and len(done_keys) == len(group_keys[group]))
+        return fits
+
+    def report(self):
+        """
+        Returns:
+            per-worker task count, busy time and utilization over the wall time the pool was in use
+        """
+        if self.start_time is None or self.end_time is None:
+            return "workers: {} (unused)".format(self.max_workers)
+        wall = self.end_time - self.start_time
+        busy = sum(worker[1] for worker in self.worker_busy.values())
+        lines = ["workers: {} wall: {:.2f}s busy: {:.2f}s cpu: {:.2f}s utilization: {:.0%}".format(
+            self.max_workers, wall, busy, self.cpu_time, busy / (wall * self.max_workers) if wall > 0 else 0)]
+        for pid, (tasks, worker_busy, worker_cpu) in sorted(self.worker_busy.items()):
+            lines.append("  worker {}: {} tasks busy: {:.2f}s cpu: {:.2f}s utilization: {:.0%}".format(
+                pid, tasks, worker_busy, worker_cpu, worker_busy / wall if wall > 0 else 0))
+        return "\n".join(lines)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class PhaseTimer:
+    """
+    Wall and CPU time of consecutive pipeline phases, each phase ends at mark(name).
+    CPU counts this process, its children and the pool workers of scheduler.
+    """
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler
+        self.phases = []
+        self.start = self.last = self._now()
+
+    def _now(self):
+        worker_cpu = self.scheduler.cpu_time if self.scheduler is not None else 0.0
+        return time.perf_counter(), profiling.cpu_time() + worker_cpu
+
+    def mark(self, name):
+        now = self._now()
+        self.phases.append((name, now[0] - self.last[0], now[1] - self.last[1]))
+        self.last = now
+
+    def wall_time(self, *names):
+        """
+        wall seconds of the phases in names, of all the marked phases if none is given
+        """
+        return sum(wall for name, wall, _ in self.phases if not names or name in names)
+
+    def cpu_time(self):
+        return sum(cpu for _, _, cpu in self.phases)
+
+    def elapsed(self, timestamp, after=()):
+        """
+        seconds from the end of the phases in after (from the start if empty) to a time.perf_counter() timestamp
+        """
+        return max(timestamp - self.start[0] - self.wall_time(*after) if after else timestamp - self.start[0], 0.0)
+
+
+def search_slice_number(slice_infos, scheduler, device_depth):
+    """
+    Find the candidate with the fewest slices that all fit device_depth without compiling every candidate.
+    Fitting is taken as monotone in the slice number: candidates are probed by galloping from the
+    fewest slices, then bisection between the last failing and the first fitting probe.
+    A failing probe stops at its first slice deeper than device_depth.
+
+    Returns:
+        the probed Slice_info, in probe order
+    """
+    candidates = sorted(slice_infos, key=lambda item: item.get_slice_number())
+    probed = []
+    fits = {}
+
+    def probe(index):
+        if index not in fits:
+            fits[index] = scheduler.run(candidates[index], device_depth)
+            probed.append(candidates[index])
+        return fits[index]
+
+    # galloping: 0, 1, 3, 7, ... until a candidate fits
+    failed = -1
+    step = 1
+    index = 0
+    while index < len(candidates) and not probe(index):
+        failed = index
+        index += step
+        step *= 2
+    found = index if index < len(candidates) else len(candidates)
+    if found == len(candidates) and failed < len(candidates) - 1:
+        # every galloping probe failed, the largest candidate decides
+        if probe(len(candidates) - 1):
+            found = len(candidates) - 1
+        else:
+            failed = len(candidates) - 1
+    # bisection between the last failing and the first fitting probe
+    while found - failed > 1:
+        middle = (found + failed) // 2
+        if probe(middle):
+            found = middle
+        else:
+            failed = middle
+    return probed
+
+
+def run_parallel(slice_infoes: list[Slice_info], coupling_file, backend="EEQM_scale", device_depth=None,
+                 expected_slice_number=None, scheduler=None):
+    """
+    Compile the slices of every Slice_info in a process pool, each distinct slice once.
+    With device_depth, a Slice_info stops at its first slice deeper than the device and the rest
+    of its slices are cancelled (its data is then partial, see Slice_info.stopped).
+    expected_slice_number: Slice_info closest to it are scheduled first
+    scheduler: SliceScheduler to reuse across calls, a temporary one is created if None
+
+    Returns:
+        number of slices compiled
+    """
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = SliceScheduler(coupling_file, backend)
+    compiled = scheduler.compiled()
+    prioritized = expected_slice_number is not None
+    if prioritized:
+        slice_infoes = sorted(slice_infoes, key=lambda item: abs(item.get_slice_number() - expected_slice_number))
+    scheduler.run_groups(slice_infoes, device_depth, prioritized)
+    compiled = scheduler.compiled() - compiled
+    if own_scheduler:
+        scheduler.close()
+    return compiled
 
 
 if __name__ == '__main__':
@@ -135,13 +496,35 @@ if __name__ == '__main__':
     qasm_file = sys.argv[1]
     coupling_file = sys.argv[2]
     device_depth = int(sys.argv[3])
+    # EEQM_scale (one process per slice), worker (resident router per pool process)
+    # or builtin (NumPy router in the pool process)
+    backend = sys.argv[4] if len(sys.argv) > 4 else "EEQM_scale"
+    # options after the backend:
+    #   archive  slices stay in memory unless this is given, then they are also written as qasm files under result_dir
+    #   search   probe slice numbers by galloping/bisection instead of compiling every candidate in arg list
+    #   cache    reuse results of identical slices from earlier runs (see compile_cache), a result of a
+    #            VF2 mapped slice is then one earlier sample, and slices of archive runs are always routed
+    options = sys.argv[5:]
+    archive = "archive" in options
+    search = "search" in options
+    use_cache = "cache" in options
     coupling_name = os.path.basename(coupling_file)
 
     result_path = result_dir + coupling_name
 
     qasm_name = os.path.basename(qasm_file)
-    circuit = QuantumCircuit.from_QASM(qasm_file)
-    dagtable = np.array(circuit.to_dagtable())
+    circuit_name = os.path.splitext(qasm_name)[0]
+    # one pool for the sampling, the sweep and the search, sized from the cores available
+    scheduler = SliceScheduler(coupling_file, backend, use_cache=use_cache)
+    phases = PhaseTimer(scheduler)
+    with span("parse"):
+        # .qcb files (see convert_circuits.py) are mapped, the pool workers then share their pages
+        if qasm_file.endswith('.qcb'):
+            circuit = QuantumCircuit.from_binary(qasm_file)
+        else:
+            circuit = QuantumCircuit.from_QASM(qasm_file, lazy_dag=True)
+    with span("dagtable"):
+        dagtable = circuit.to_dagtable()
     circuit_depth = dagtable.shape[1]
     total_gate_cnt = np.sum(np.where(dagtable != -1, 1, 0))
 
@@ -150,14 +533,22 @@ if __name__ == '__main__':
     initial_gate_cnt = int(total_gate_cnt / initial_slice_number)
     initial_depth = int(device_depth / 2)
 
-    write_path = os.path.join(result_path + str(device_depth), qasm_name[:-5])
+    write_path = os.path.join(result_path + str(device_depth), circuit_name)
     if not os.path.exists(write_path):
         os.makedirs(write_path)
-    qasm_files = sample(qasm_file, 20, 'depth', initial_depth, write_path)
-    depth_sample_slice_info = Slice_info(qasm_files, 'depth', 20)
-    qasm_files = sample(qasm_file, 20, 'gatecnt', initial_gate_cnt, write_path)
-    gatecnt_sample_slice_info = Slice_info(qasm_files, 'gatecnt', 20)
-    run_parallel([depth_sample_slice_info, gatecnt_sample_slice_info], coupling_file)
+    with span("layer_index"):
+        layer_index = LayerIndex(circuit)
+    phases.mark("prepare")
+    with span("sampling"):
+        depth_samples = sample_slices(circuit, 20, 'depth', initial_depth, layer_index)
+        gatecnt_samples = sample_slices(circuit, 20, 'gatecnt', initial_gate_cnt, layer_index)
+    depth_sample_slice_info = make_slice_info(depth_samples, 'depth', 20,
+                                              os.path.join(write_path, 'depthsample') if archive else None)
+    gatecnt_sample_slice_info = make_slice_info(gatecnt_samples, 'gatecnt', 20,
+                                                os.path.join(write_path, 'gatecntsample') if archive else None)
+    with span("sample_compile"):
+        run_parallel([depth_sample_slice_info, gatecnt_sample_slice_info], coupling_file, backend, scheduler=scheduler)
+    phases.mark("sampling")
     # slice_info.draw()
     # depth_sample_slice_info.draw()
     # gatecnt_sample_slice_info.draw()
@@ -192,6 +583,7 @@ if __name__ == '__main__':
                 low_bound_depth = initial_depth
         up_bound_slice_number = int(circuit_depth / low_bound_depth) + 1
         low_bound_slice_number = int(circuit_depth / up_bound_depth) + 1
+        expected_slice_number = int(circuit_depth / bound_depth) + 1
         arg_list = []
         bias = up_bound_slice_number - low_bound_slice_number
         if bias < 10:
@@ -208,6 +600,7 @@ if __name__ == '__main__':
         # device_depth/(max_depth/gate_cnt)
         bound_gate_cnt = device_depth * initial_gate_cnt / max_depth
         bound_slice_number = int(total_gate_cnt / bound_gate_cnt)
+        expected_slice_number = bound_slice_number
         bias = abs(bound_slice_number - initial_slice_number)
         if bias < 5:
             bias = 5
@@ -228,22 +621,41 @@ if __name__ == '__main__':
     print("better method:", better_method)
     print("arg list:", arg_list)
     slice_info_list = []
-    for arg in arg_list:
-        write_path = os.path.join(result_path + str(device_depth), qasm_name[:-5], str(arg))
-        if not os.path.exists(write_path):
-            os.mkdir(write_path)
-        qasm_files = cut_circuit(qasm_file, write_path, better_method, arg)
-        slice_info_list.append(Slice_info(qasm_files, better_method, arg))
-    run_parallel(slice_info_list, coupling_file)
-    log_file = write_path = os.path.join(result_path + str(device_depth), qasm_name[:-5], 'log')
+    with span("cutting"):
+        sweep = sweep_slices(circuit, better_method, arg_list, layer_index)
+    for arg, circuit_slices in sweep:
+        archive_path = None
+        if archive:
+            archive_path = os.path.join(result_path + str(device_depth), circuit_name, str(arg), circuit_name)
+        slice_info_list.append(make_slice_info(circuit_slices, better_method, arg, archive_path, circuit_name + '_'))
+    phases.mark("cutting")
+    if search:
+        compiled = scheduler.compiled()
+        with span("compile"):
+            slice_info_list = search_slice_number(slice_info_list, scheduler, device_depth)
+        compiled = scheduler.compiled() - compiled
+        print("probed slice numbers:", [item.get_slice_number() for item in slice_info_list])
+    else:
+        with span("compile"):
+            compiled = run_parallel(slice_info_list, coupling_file, backend, device_depth, expected_slice_number,
+                                    scheduler)
+    phases.mark("compile")
+    print(scheduler.report())
+    scheduler.close()
+    print("slices:", sum(item.get_slice_number() for item in slice_info_list), "compiled:", compiled)
+    log_file = write_path = os.path.join(result_path + str(device_depth), circuit_name, 'log')
 
     min_slice_number = 10000
     min_total_depth = 100000
     best_slice_max_depth = 10000
     best_slice_max_time = 10000
+    # perf_counter() when the chosen slice number had all its results
+    best_slice_ready_at = None
     each_slice_number_max_time = []
     with open(log_file, 'w') as f:
         f.write("better method: {} max depth: {} sample time: {}\n".format(better_method, max_depth, sample_time))
+        for name, wall, cpu in phases.phases:
+            f.write("phase: {} wall time: {:.4f} cpu time: {:.4f}\n".format(name, wall, cpu))
         for item in slice_info_list:
             # item.draw()
             data = item.get_data()
@@ -253,8 +665,10 @@ if __name__ == '__main__':
             max_depth = np.max(npdata[:, 1])
             max_time = np.max(npdata[:, 0])
             each_slice_number_max_time.append(max_time)
-            f.write("slice_number: {}  max depth: {} max time: {} total depth: {}\n".format(slice_number, max_depth,
-                                                                                            max_time, total_depth))
+            f.write("slice_number: {}  max depth: {} max time: {} total depth: {} ready time: {:.4f} cpu time: {:.4f}{}\n".format(
+                slice_number, max_depth, max_time, total_depth,
+                phases.elapsed(item.ready_at, ("prepare", "sampling", "cutting")), item.cpu_time,
+                " (stopped at the first slice over device depth)" if item.stopped else ""))
             # f.write(str(data)+'\n')
             if max_depth <= device_depth:
                 if slice_number < min_slice_number or (
@@ -263,8 +677,22 @@ if __name__ == '__main__':
                     min_total_depth = total_depth
                     best_slice_max_depth = max_depth
                     best_slice_max_time = max_time
-        max_max_time = np.max(each_slice_number_max_time[1:])
-        f.write("best slice number: {} max depth: {} total time: {} total depth: {}".format(min_slice_number,
-                                                                                            best_slice_max_depth,
-                                                                                            sample_time + max_max_time,
-                                                                                            min_total_depth))
+                    best_slice_ready_at = item.ready_at
+        # the original field: slowest sample plus the slowest slice of the slice numbers after the first
+        total_time = sample_time + max(each_slice_number_max_time[1:], default=0.0)
+        # router-reported seconds only: the slowest sample plus the slowest slice of any slice number
+        router_time = sample_time + max(each_slice_number_max_time, default=0.0)
+        # what this schedule achieved: from the start until the chosen slice number was complete
+        critical_path = phases.wall_time("prepare", "sampling", "cutting", "compile")
+        if best_slice_ready_at is not None:
+            critical_path = phases.elapsed(best_slice_ready_at)
+        # fields up to total depth are the original ones, the timing ones are appended after them
+        f.write("best slice number: {} max depth: {} total time: {} total depth: {} router time: {} "
+                "wall time: {:.4f} cpu time: {:.4f} critical path: {:.4f}".format(min_slice_number,
+                                                                                  best_slice_max_depth, total_time,
+                                                                                  min_total_depth, router_time,
+                                                                                  phases.wall_time(),
+                                                                                  phases.cpu_time(), critical_path))
+    # per-stage breakdown of this circuit, spans of the pool workers included
+    profiling.dump(os.path.join(os.path.dirname(log_file), 'timing'))
+    print(profiling.report())
@@ -0,0 +1,263 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : microbench.py
+# @IDE     : PyCharm
+"""
+Microbenchmarks of the quantumcircuit hot paths (parser, add_gate, dagtable, QASM writer)
+and of the circuit cutting functions, on representative files of qasm-benchmark/ and on
+generated Ising circuits.
+
+Every operation is timed over several runs (min and median seconds) and its peak Python
+allocation is measured once with tracemalloc. Results are written as JSON together with the
+commit and the machine they were measured on. With --compare, operations whose min time or
+peak memory grew by more than THRESHOLD (and by more than MIN_TIME_DELTA / MIN_BYTES_DELTA)
+over a baseline written by an earlier run (BASELINE by default) are listed and the exit code is 1.
+Timings only compare on the same machine: BASELINE was measured on the host recorded in its
+meta, refresh it there when an operation gets faster on purpose.
+
+usage: python microbench.py [result.json] [--compare [baseline.json]] [--threshold threshold]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+from quantumcircuit import QuantumCircuit
+from circuit_slices import get_gates, get_layers_gates, LayerIndex, slice_circuit_depth, slice_circuit_gate
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(ROOT, "qasm-benchmark")
+BASELINE = os.path.join(ROOT, "microbench_baseline.json")
+# small / medium / large of each family
+# (the files of qasm-benchmark/Ising/ are simulator logs, not qasm, their sizes are generated instead)
+CIRCUITS = [
+    "BV/bv_n14.qasm", "BV/bv_99.qasm", "BV/bv_399.qasm",
+    "QFT/qft_n15.qasm", "QFT/qft_100.qasm", "QFT/qft_400.qasm",
+    "ising_n10", "ising_n100", "ising_n1000",
+    "QAOA/qaoa_max_cut_10.qasm", "QAOA/qaoa_max_cut_50.qasm", "QAOA/qaoa_max_cut_90.qasm",
+]
+# generated circuit -> qubit number
+GENERATED = {"ising_n10": 10, "ising_n100": 100, "ising_n1000": 1000}
+# trotter steps of the generated Ising circuits
+ISING_STEPS = 10
+# relative growth of min time or peak memory reported as a regression
+THRESHOLD = 1.25
+# smaller absolute growths are timer and scheduling noise, not regressions
+MIN_TIME_DELTA = 0.001
+MIN_BYTES_DELTA = 64 * 1024
+# each operation runs at least MIN_REPEAT times and until MIN_TIME seconds are spent, at most MAX_REPEAT times
+MIN_REPEAT = 3
+MAX_REPEAT = 50
+MIN_TIME = 0.5
+
+
+def write_ising(qubit_number, filename, steps=ISING_STEPS):
+    """
+    Trotterized 1D transverse field Ising chain: every step is an RZZ (cx rz cx) on the even bonds,
+    then on the odd bonds, then an RX on every qubit, so the circuit is periodic in its layers.
+    """
+    lines = ['OPENQASM 2.0;', 'include "qelib1.inc";', 'qreg q[{}];'.format(qubit_number),
+             'creg c[{}];'.format(qubit_number)]
+    lines += ['h q[{}];'.format(qubit) for qubit in range(qubit_number)]
+    for _ in range(steps):
+        for first in (0, 1):
+            for qubit in range(first, qubit_number - 1, 2):
+                lines += ['cx q[{}],q[{}];'.format(qubit, qubit + 1), 'rz(0.2) q[{}];'.format(qubit + 1),
+                          'cx q[{}],q[{}];'.format(qubit, qubit + 1)]
+        lines += ['rx(0.4) q[{}];'.format(qubit) for qubit in range(qubit_number)]
+    with open(filename, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def circuit_path(name, scratch):
+    """
+    Returns:
+        qasm file of a CIRCUITS entry, generated circuits are written to scratch
+    """
+    if name in GENERATED:
+        path = os.path.join(scratch, name + ".qasm")
+        if not os.path.exists(path):
+            write_ising(GENERATED[name], path)
+        return path
+    return os.path.join(BENCHMARK_DIR, name)
+
+
+def fresh_dagtable(circuit):
+    # drop the cached table so it is built again
+    circuit._dagtable = None
+    return circuit.to_dagtable()
+
+
+def rebuild(circuit):
+    qc = QuantumCircuit(circuit.get_qubit_number(), lazy_dag=True)
+    for gate in circuit.gate_list[1:]:
+        qc.add_gate(gate)
+    return qc
+
+
+def all_layers_get_gates(dagtable):
+    return [get_gates(dagtable[:, layer]) for layer in range(dagtable.shape[1])]
+
+
+def write_qasm(circuit, scratch):
+    circuit.to_QASM(os.path.join(scratch, "out.qasm"))
+
+
+def operations(path, circuit, scratch):
+    """
+    Returns:
+        list of (name, function of no argument) measured on circuit
+    """
+    dagtable = circuit.to_dagtable()
+    layer_index = LayerIndex(circuit)
+    slice_depth = max(circuit.get_circuit_depth() // 10, 1)
+    return [
+        ("from_QASM", lambda: QuantumCircuit.from_QASM(path)),
+        ("from_QASM_lazy", lambda: QuantumCircuit.from_QASM(path, lazy_dag=True)),
+        ("from_QASM_compact", lambda: QuantumCircuit.from_QASM(path, compact=True, lazy_dag=True)),
+        ("add_gate", lambda: rebuild(circuit)),
+        ("to_dagtable", lambda: fresh_dagtable(circuit)),
+        ("get_circuit_depth", circuit.get_circuit_depth),
+        ("get_gates", lambda: all_layers_get_gates(dagtable)),
+        ("get_layers_gates", lambda: get_layers_gates(dagtable)),
+        ("to_QASM", lambda: write_qasm(circuit, scratch)),
+        ("LayerIndex", lambda: LayerIndex(circuit)),
+        ("slice_circuit_depth", lambda: slice_circuit_depth(circuit, slice_depth, LayerIndex(circuit))),
+        ("slice_circuit_gate", lambda: slice_circuit_gate(circuit, 10, LayerIndex(circuit))),
+        ("slice_circuit_gate_indexed", lambda: slice_circuit_gate(circuit, 10, layer_index)),
+    ]
+
+
+def measure(function):
+    """
+    Returns:
+        {"time_min", "time_median", "repeat", "peak_bytes"}
+    """
+    times = []
+    start = time.perf_counter()
+    while len(times) < MAX_REPEAT and (len(times) < MIN_REPEAT or time.perf_counter() - start < MIN_TIME):
+        begin = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - begin)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"time_min": min(times), "time_median": float(np.median(times)), "repeat": len(times), "peak_bytes": peak}
+
+
+def git_commit():
+    """
+    Returns:
+        short hash of HEAD, with a "-dirty" suffix if tracked files differ from it, None outside git
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+    if not commit:
+        return None
+    return commit + "-dirty" if dirty else commit
+
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+
+def machine_info():
+    return {"host": platform.node(), "machine": platform.machine(), "cpu": cpu_model(), "cpus": os.cpu_count(),
+            "system": platform.platform()}
+
+
+def run_benchmarks(circuits=CIRCUITS):
+    """
+    Returns:
+        {"meta": {...}, "results": {"<circuit>:<operation>": measure(...)}, "skipped": {circuit: reason}}
+    """
+    results = {}
+    skipped = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for name in circuits:
+            path = circuit_path(name, scratch)
+            circuit = QuantumCircuit.from_QASM(path, lazy_dag=True) if os.path.exists(path) else None
+            if circuit is None:
+                skipped[name] = "missing" if not os.path.exists(path) else "not parsable"
+                continue
+            for operation, function in operations(path, circuit, scratch):
+                key = name + ":" + operation
+                results[key] = measure(function)
+                print("{:<55} {:>10.6f}s {:>12} B".format(key, results[key]["time_min"], results[key]["peak_bytes"]))
+    meta = {"commit": git_commit(), "python": platform.python_version(), "numpy": np.__version__,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+    meta.update(machine_info())
+    return {"meta": meta, "results": results, "skipped": skipped}
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Returns:
+        list of (key, metric, baseline value, new value) that grew by more than threshold
+    """
+    regressions = []
+    for key, new in results["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+        for metric, min_delta in (("time_min", MIN_TIME_DELTA), ("peak_bytes", MIN_BYTES_DELTA)):
+            if new[metric] > threshold * old[metric] and new[metric] - old[metric] > min_delta:
+                regressions.append((key, metric, old[metric], new[metric]))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="quantumcircuit and circuit cutting microbenchmarks")
+    parser.add_argument("result_file", nargs="?", default="microbench.json")
+    parser.add_argument("--compare", nargs="?", const=BASELINE, default=None, metavar="baseline.json",
+                        help="report regressions against a baseline, " + os.path.basename(BASELINE) + " by default")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    results = run_benchmarks()
+    for name, reason in results["skipped"].items():
+        print("skipped {}: {}".format(name, reason))
+    with open(args.result_file, "w") as f:
+        json.dump(results, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        host, cpu = baseline["meta"].get("host"), baseline["meta"].get("cpu")
+        if (host, cpu) != (results["meta"]["host"], results["meta"]["cpu"]):
+            print("warning: baseline measured on {} ({}), this run on {} ({}), timings may not compare".format(
+                host, cpu, results["meta"]["host"], results["meta"]["cpu"]))
+        regressions = compare(results, baseline, args.threshold)
+        for key, metric, old, new in regressions:
+            print("regression {} {}: {:.6g} -> {:.6g} ({:.2f}x)".format(key, metric, old, new, new / old))
+        print("compared with {} ({}): {} regressions".format(args.compare, baseline["meta"].get("commit"),
+                                                            len(regressions)))
+        if regressions:
+            exit(1)
@@ -0,0 +1,181 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : profiling.py
+# @IDE     : PyCharm
+"""
+Named timing spans for the cut-and-compile pipeline.
+
+    with span("parse"):
+        circuit = QuantumCircuit.from_QASM(...)
+
+adds the wall and CPU time of the block to the "parse" entry of this process. Pool workers send their
+entries back with collect() and the driver adds them to its own with merge(), so the breakdown
+written by dump() covers every process (times of worker spans are summed over the workers).
+
+Stages named in the EEQM_PROFILE environment variable (comma separated, or "all") are also run
+under cProfile, and dump() writes their merged statistics as <stage>.prof files.
+"""
+import os
+import sys
+import time
+import cProfile
+import pstats
+from contextlib import contextmanager
+
+# stages to run under cProfile, inherited by pool workers
+EEQM_PROFILE = {stage.strip() for stage in os.environ.get("EEQM_PROFILE", "").split(",") if stage.strip()}
+
+# name -> [count, wall seconds, cpu seconds]
+_spans = {}
+# name -> pstats.Stats
+_profiles = {}
+_profiling = False
+# cpu seconds reported by processes this one does not wait for, e.g. the resident router of router_service
+_external_cpu = 0.0
+
+
+class _ProfileStats:
+    # what pstats.Stats.load_stats reads from a profiler: create_stats() then stats
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def cpu_time():
+    """
+    user + system time of this process, of its waited-for children (EEQM_scale runs)
+    and reported with add_external_cpu()
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system + _external_cpu
+
+
+def add_external_cpu(seconds):
+    """
+    count cpu seconds of a process os.times() does not see, such as a router worker that is still running
+    """
+    global _external_cpu
+    _external_cpu += seconds
+
+
+def profiled(name):
+    return name in EEQM_PROFILE or "all" in EEQM_PROFILE
+
+
+@contextmanager
+def span(name):
+    """
+    time the block under name, and profile it if name is in EEQM_PROFILE
+    (nested spans inside a profiled one are only timed, cProfile can not nest)
+    """
+    global _profiling
+    profiler = None
+    if not _profiling and profiled(name):
+        profiler = cProfile.Profile()
+        _profiling = True
+        profiler.enable()
+    start = time.perf_counter()
+    start_cpu = cpu_time()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        cpu = cpu_time() - start_cpu
+        if profiler is not None:
+            profiler.disable()
+            _profiling = False
+            profiler.create_stats()
+            _add_profile(name, profiler.stats)
+        add(name, elapsed, cpu=cpu)
+
+
+def add(name, seconds, count=1, cpu=0.0):
+    """
+    record a duration measured elsewhere, e.g. the queueing time of a pool task
+    """
+    entry = _spans.setdefault(name, [0, 0.0, 0.0])
+    entry[0] += count
+    entry[1] += seconds
+    entry[2] += cpu
+
+
+def _add_profile(name, stats):
+    if name in _profiles:
+        _profiles[name].add(_ProfileStats(stats))
+    else:
+        _profiles[name] = pstats.Stats(_ProfileStats(stats))
+
+
+def reset():
+    """
+    forget the spans and the running profiler inherited from the parent process through fork,
+    called when a pool worker starts
+    """
+    global _spans, _profiles, _profiling
+    if _profiling:
+        sys.setprofile(None)
+        _profiling = False
+    _spans = {}
+    _profiles = {}
+
+
+def collect():
+    """
+    take the spans and profiles recorded in this process since the last collect
+
+    Returns:
+        picklable snapshot for merge()
+    """
+    global _spans, _profiles
+    snapshot = (_spans, {name: profile.stats for name, profile in _profiles.items()})
+    _spans = {}
+    _profiles = {}
+    return snapshot
+
+
+def merge(snapshot):
+    """
+    add a snapshot from collect(), usually of a pool worker, to this process
+    """
+    spans, profiles = snapshot
+    for name, (count, seconds, cpu) in spans.items():
+        add(name, seconds, count, cpu)
+    for name, stats in profiles.items():
+        _add_profile(name, stats)
+
+
+def report():
+    """
+    Returns:
+        one line per span: name, count, total wall seconds, mean milliseconds and total cpu seconds,
+        longest total first
+    """
+    lines = ["{:<20} {:>8} {:>12} {:>12} {:>12}".format("span", "count", "total (s)", "mean (ms)", "cpu (s)")]
+    for name, (count, seconds, cpu) in sorted(_spans.items(), key=lambda item: -item[1][1]):
+        lines.append("{:<20} {:>8} {:>12.4f} {:>12.4f} {:>12.4f}".format(name, count, seconds,
+                                                                         1000 * seconds / count, cpu))
+    return "\n".join(lines)
+
+
+def dump(timing_file):
+    """
+    write report() to timing_file and the profiles as <stage>.prof next to it
+    """
+    with open(timing_file, 'w') as f:
+        f.write(report() + "\n")
+    directory = os.path.dirname(timing_file)
+    for name, profile in _profiles.items():
+        profile.dump_stats(os.path.join(directory, name + ".prof"))
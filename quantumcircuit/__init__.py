@@ -1,4 +1,6 @@
 # -*- coding: UTF-8 -*-
 from .circuit import *
 from .gate import *
+from .gatestore import GateStore, GateView
 from .register import *
+from .view import CircuitView
@@ -0,0 +1,131 @@
+# -*- coding: UTF-8 -*-
+'''
+Binary circuit container, read back with one np.memmap.
+
+layout (little endian), every section starts on a 64-byte boundary:
+    header   magic "EEQMQCB1", version, qubit number, cbit number, flags,
+             gate rows (Init included), dagtable columns
+    opcode   int8[rows]      GateStore opcodes, row 0 is Init
+    qubit0   int32[rows]
+    qubit1   int32[rows]     -1 for single-qubit gates and Init
+    para     float64[rows]
+    layers   int32[rows]     dagtable column of every gate, -1 for Init
+    dagtable int32[qubit number, columns], only if flags & FLAG_DAGTABLE
+
+Mapped circuits share the file pages between processes, so pool workers
+opening the same file do not each hold a copy of the gates.
+'''
+import os
+import struct
+import numpy as np
+from quantumcircuit.circuit import QuantumCircuit
+from quantumcircuit.gatestore import OP_INIT
+
+MAGIC = b"EEQMQCB1"
+VERSION = 1
+FLAG_DAGTABLE = 1
+_HEADER = struct.Struct("<8sIIIIQQ")
+_ALIGN = 64
+_COLUMNS = (("opcode", "<i1"), ("qubit0", "<i4"), ("qubit1", "<i4"), ("para", "<f8"), ("layers", "<i4"))
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _sections(rows, qubit_number, layer_number, flags):
+    '''
+    :return: [(name, dtype, shape, offset)] and the file size
+    '''
+    sections = []
+    offset = _aligned(_HEADER.size)
+    for name, dtype in _COLUMNS:
+        sections.append((name, dtype, (rows,), offset))
+        offset = _aligned(offset + rows * np.dtype(dtype).itemsize)
+    if flags & FLAG_DAGTABLE:
+        sections.append(("dagtable", "<i4", (qubit_number, layer_number), offset))
+        offset = _aligned(offset + qubit_number * layer_number * 4)
+    return sections, offset
+
+
+def write_binary(circuit, filename, dagtable=True):
+    '''
+    :param circuit: QuantumCircuit or CircuitView, gates GateStore does not support raise ValueError
+    :param filename:
+    :param dagtable: also store the dagtable
+    '''
+    opcode, qubit0, qubit1, para = circuit.get_gate_columns()
+    layers = circuit.get_gate_layers()
+    qubit_number = circuit.get_qubit_number()
+    columns = {
+        "opcode": np.concatenate(([OP_INIT], opcode)),
+        "qubit0": np.concatenate(([-1], qubit0)),
+        "qubit1": np.concatenate(([-1], qubit1)),
+        "para": np.concatenate(([0.0], para)),
+        "layers": layers,
+    }
+    rows = len(layers)
+    layer_number = circuit.get_circuit_depth() - 1
+    flags = 0
+    if dagtable:
+        flags |= FLAG_DAGTABLE
+        columns["dagtable"] = circuit.to_dagtable()
+    sections, size = _sections(rows, qubit_number, layer_number, flags)
+    with open(filename, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, qubit_number, circuit.cbit_number, flags, rows, layer_number))
+        for name, dtype, shape, offset in sections:
+            f.seek(offset)
+            f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        f.truncate(size)
+
+
+def read_binary(filename, mmap=True):
+    '''
+    :param filename: file written by write_binary
+    :param mmap: map the file read-only instead of reading it into memory
+    :return: compact lazy_dag QuantumCircuit over the stored columns
+    '''
+    if mmap:
+        data = np.memmap(filename, dtype=np.uint8, mode="r")
+    else:
+        data = np.fromfile(filename, dtype=np.uint8)
+    if len(data) < _HEADER.size:
+        raise ValueError(filename + " is not a binary circuit")
+    magic, version, qubit_number, cbit_number, flags, rows, layer_number = _HEADER.unpack(
+        data[:_HEADER.size].tobytes())
+    if magic != MAGIC:
+        raise ValueError(filename + " is not a binary circuit")
+    if version != VERSION:
+        raise ValueError("%s: binary circuit version %d, this reader knows %d" % (filename, version, VERSION))
+    sections, size = _sections(rows, qubit_number, layer_number, flags)
+    if len(data) < size:
+        raise ValueError(filename + " is truncated")
+    columns = {}
+    for name, dtype, shape, offset in sections:
+        count = int(np.prod(shape))
+        column = data[offset:offset + count * np.dtype(dtype).itemsize].view(dtype).reshape(shape)
+        column.flags.writeable = False
+        columns[name] = column
+    qc = QuantumCircuit.from_columns(qubit_number, columns["opcode"], columns["qubit0"], columns["qubit1"],
+                                     columns["para"], columns["layers"], cbit_number)
+    if "dagtable" in columns:
+        qc._dagtable = columns["dagtable"]
+    qc.binary_path = os.path.abspath(filename) if mmap else None
+    return qc
+
+
+_circuits = {}
+
+
+def load_binary(filename):
+    '''
+    mapped circuit of a binary file, memoized by path and modification time,
+    so the views of one circuit sent to a pool worker open the file once
+    '''
+    path = os.path.abspath(filename)
+    key = (path, os.stat(path).st_mtime_ns)
+    if key not in _circuits:
+        for stale in [k for k in _circuits if k[0] == path]:
+            del _circuits[stale]
+        _circuits[key] = read_binary(path)
+    return _circuits[key]
@@ -4,14 +4,26 @@ import copy
 import random
 import math
 import importlib
+from array import array
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 from quantumcircuit.gate import *
+from quantumcircuit.gatestore import GateStore, GATE_NAMES, OP_INIT
+from quantumcircuit.dagtable import build_dagtable, assign_layers
 from quantumcircuit.register import *
 
 
 class QuantumCircuit:
-    def __init__(self, qubit_number=None, cbit_number=0):
+    def __init__(self, qubit_number=None, cbit_number=0, compact=False, lazy_dag=False):
+        '''
+        :param qubit_number:
+        :param cbit_number:
+        :param compact: keep gate_list as a columnar GateStore (NumPy arrays + GateView)
+                        instead of a list of Gate objects, for very large circuits
+        :param lazy_dag: do not maintain the networkx DAG in add_gate, it is built from the
+                         predecessor links the first time graph_circuit is used
+        '''
         if qubit_number ==None:
             self.qubit_number = 0
         else:
@@ -23,26 +35,119 @@ class QuantumCircuit:
         self.gate_set = set()
         self.last_gate_on_qubit = [None for _ in range(qubit_number)]
         self.begin_gate_on_qubit = [None for _ in range(qubit_number)]
-        self.graph_circuit = nx.DiGraph()
-        self.gate_list = []
+        # gate i depends on gate_predecessors[2i] (on its first qubit) and gate_predecessors[2i+1]
+        # (on its second qubit), gate_successors is laid out the same way, -1 means none
+        self.gate_predecessors = array('i')
+        self.gate_successors = array('i')
+        self.last_slot_on_qubit = [-1 for _ in range(qubit_number)]
+        self.init_successors = []
+        # depth of the deepest gate on each qubit (Init counts as depth 1), kept by add_gate
+        self.qubit_depth = [0 for _ in range(qubit_number)]
+        self.circuit_depth = 0
+        # dagtable column of every gate (-1 for Init) and the cached table built from it
+        self.gate_layers = array('i')
+        self._dagtable = None
+        self._gate_qubits = None
+        self._gate_columns = None
+        # file the gates are mapped from (see from_binary), None once the circuit differs from it
+        self.binary_path = None
+        self.lazy_dag = lazy_dag
+        self._graph_circuit = None if lazy_dag else nx.DiGraph()
+        self.compact = compact
+        if compact:
+            self.gate_list = GateStore(self.qubit_number)
+        else:
+            self.gate_list = []
         self.initialize(Init(qubit_number))
 
     def add_gate(self, gate):
         qubits = gate.get_qubits()
         node_id = self.gate_number
         self.gate_number = self.gate_number + 1
-        self.graph_circuit.add_node(node_id, gate=gate)
-        for qubit in qubits:
+        graph = self._graph_circuit
+        if graph is not None:
+            graph.add_node(node_id, gate=gate)
+        predecessors = self.gate_predecessors
+        successors = self.gate_successors
+        qubit_depth = self.qubit_depth
+        depth = max(qubit_depth[qubit] for qubit in qubits) + 1
+        if depth > self.circuit_depth:
+            self.circuit_depth = depth
+        for slot, qubit in enumerate(qubits):
             assert qubit < self.qubit_number
             if self.begin_gate_on_qubit[qubit] == None:
                 self.last_gate_on_qubit[qubit] = node_id
                 self.begin_gate_on_qubit[qubit] = node_id
+                predecessors.append(-1)
             else:
-                self.graph_circuit.add_edge(self.last_gate_on_qubit[qubit], node_id)
+                last_gate = self.last_gate_on_qubit[qubit]
+                if graph is not None:
+                    graph.add_edge(last_gate, node_id)
+                predecessors.append(last_gate)
+                if last_gate == 0:
+                    if not self.init_successors or self.init_successors[-1] != node_id:
+                        self.init_successors.append(node_id)
+                else:
+                    successors[self.last_slot_on_qubit[qubit]] = node_id
                 self.last_gate_on_qubit[qubit] = node_id
+            self.last_slot_on_qubit[qubit] = 2 * node_id + slot
+            qubit_depth[qubit] = depth
+        self.gate_layers.append(depth - 2)
+        self._dagtable = None
+        self._gate_qubits = None
+        self._gate_columns = None
+        self.binary_path = None
+        if len(qubits) == 1:
+            predecessors.append(-1)
+        successors.append(-1)
+        successors.append(-1)
         self.gate_set.add(gate.get_name())
         self.gate_list.append(gate)
 
+    def get_predecessors(self, gate_id):
+        '''
+        :param gate_id:
+        :return: ids of the gates that gate_id directly depends on
+        '''
+        if gate_id == 0:
+            return []
+        first = self.gate_predecessors[2 * gate_id]
+        second = self.gate_predecessors[2 * gate_id + 1]
+        if second == -1 or second == first:
+            return [first] if first != -1 else []
+        return [first, second] if first != -1 else [second]
+
+    def get_successors(self, gate_id):
+        '''
+        :param gate_id:
+        :return: ids of the gates that directly depend on gate_id
+        '''
+        if gate_id == 0:
+            return list(self.init_successors)
+        first = self.gate_successors[2 * gate_id]
+        second = self.gate_successors[2 * gate_id + 1]
+        if second == -1 or second == first:
+            return [first] if first != -1 else []
+        return [first, second] if first != -1 else [second]
+
+    @property
+    def graph_circuit(self):
+        '''
+        networkx DAG of the circuit, in lazy_dag mode it is only built here, on first use,
+        and then kept up to date by add_gate
+        '''
+        if self._graph_circuit is None:
+            graph = nx.DiGraph()
+            for node_id in range(self.gate_number):
+                graph.add_node(node_id, gate=self.gate_list[node_id])
+            predecessors = self.gate_predecessors
+            for node_id in range(1, self.gate_number):
+                for slot in (2 * node_id, 2 * node_id + 1):
+                    if predecessors[slot] != -1:
+                        graph.add_edge(predecessors[slot], node_id)
+            self._graph_circuit = graph
+        return self._graph_circuit
+
     def get_gate_number(self):
         return self.gate_number
 
@@ -56,7 +161,50 @@ class QuantumCircuit:
         return self.gate_list
 
     def get_circuit_depth(self):
-        return len(nx.dag_longest_path(self.graph_circuit))
+        '''
+        number of gates on the longest path of the DAG, Init included,
+        tracked incrementally by add_gate
+        '''
+        return self.circuit_depth
+
+    def get_gate_layers(self):
+        '''
+        :return: int32 ndarray, dagtable column of every gate, -1 for Init
+        '''
+        # copy, a live buffer export would stop gate_layers from growing
+        return np.frombuffer(self.gate_layers, dtype=np.int32).copy()
+
+    def get_gate_qubits(self):
+        '''
+        :return: (qubit0, qubit1) int32 ndarrays of the gates after Init,
+                 qubit1 is -1 for single-qubit gates, cached until the next add_gate
+        '''
+        if self._gate_qubits is None:
+            if self.compact:
+                qubit0 = self.gate_list.qubits0()[1:]
+                qubit1 = self.gate_list.qubits1()[1:]
+            else:
+                qubits = [gate.get_qubits() for gate in self.gate_list[1:]]
+                qubit0 = np.array([q[0] for q in qubits], dtype=np.int32)
+                qubit1 = np.array([q[1] if len(q) > 1 else -1 for q in qubits], dtype=np.int32)
+            self._gate_qubits = (qubit0, qubit1)
+        return self._gate_qubits
+
+    def get_gate_columns(self):
+        '''
+        gates after Init in the GateStore layout, cached until the next add_gate,
+        raises ValueError for gates GateStore does not support
+        :return: (opcode, qubit0, qubit1, para) ndarrays
+        '''
+        if self._gate_columns is None:
+            if self.compact:
+                store = self.gate_list
+            else:
+                store = GateStore(self.qubit_number, len(self.gate_list))
+                for gate in self.gate_list:
+                    store.append(gate)
+            self._gate_columns = (store.opcodes()[1:], store.qubits0()[1:], store.qubits1()[1:], store.paras()[1:])
+        return self._gate_columns
 
     def to_dag_graph(self):
         return self.graph_circuit
@@ -105,11 +253,17 @@ class QuantumCircuit:
         '''
         node_id = self.gate_number
         self.gate_number = self.gate_number + 1
-        self.graph_circuit.add_node(node_id, gate=gate)
+        if self._graph_circuit is not None:
+            self._graph_circuit.add_node(node_id, gate=gate)
         qubits = gate.get_qubits()
         for qubit in qubits:
             self.last_gate_on_qubit[qubit] = node_id
             self.begin_gate_on_qubit[qubit] = node_id
+            self.qubit_depth[qubit] = 1
+        self.circuit_depth = 1
+        self.gate_layers.append(-1)
+        self.gate_predecessors.extend((-1, -1))
+        self.gate_successors.extend((-1, -1))
         self.gate_set.add(gate.get_name())
         self.gate_list.append(gate)
 
@@ -148,6 +302,8 @@ class QuantumCircuit:
         获取量子线路的信息，知道每个门有多少个
         Returns:{gate_name:gate_num} gate_name门的名字，gate_num这个门在线路总出现的次数
         '''
+        if self.compact:
+            return self.gate_list.gate_counts()
         gate_name_num = {}
         for i in range(len(self.gate_list)):
             gate = self.gate_list[i]
@@ -237,58 +393,101 @@ class QuantumCircuit:
                 "qubits in the original circuit.")
 
     @classmethod
-    def from_QASM(cls, filename):
+    def from_columns(cls, qubit_number, opcode, qubit0, qubit1, para, layers=None, cbit_number=0):
+        '''
+        compact lazy_dag circuit over existing GateStore columns, without replaying add_gate:
+        the dependency links, depths and layers add_gate would keep are derived with NumPy.
+        The columns are used as given (np.memmap included) until a gate is added.
+        :param opcode: opcode of every gate, row 0 is Init
+        :param qubit0: first qubit of every gate, -1 for Init
+        :param qubit1: second qubit, -1 for single-qubit gates and Init
+        :param para: parameter, 0 for gates without one
+        :param layers: dagtable column of every gate, -1 for Init, computed if None
+        :return: QuantumCircuit
+        '''
+        rows = len(opcode)
+        if rows == 0 or opcode[0] != OP_INIT:
+            raise ValueError("row 0 of the gate columns must be Init")
+        qc = cls(qubit_number, cbit_number, compact=True, lazy_dag=True)
+        store = qc.gate_list
+        store.opcode, store.qubit0, store.qubit1, store.para = opcode, qubit0, qubit1, para
+        store.size = rows
+        gate_qubit0 = np.asarray(qubit0[1:], dtype=np.int64)
+        gate_qubit1 = np.asarray(qubit1[1:], dtype=np.int64)
+        if layers is None:
+            layers = np.concatenate(([-1], assign_layers(qubit_number, gate_qubit0, gate_qubit1)))
+        layers = np.asarray(layers, dtype=np.int32)
+        # one slot per (gate, qubit), slot 2i + k is qubit k of gate i as in gate_predecessors
+        gate_ids = np.arange(1, rows, dtype=np.int64)
+        two_qubit = gate_qubit1 != -1
+        slot_gate = np.concatenate((gate_ids, gate_ids[two_qubit]))
+        slot_qubit = np.concatenate((gate_qubit0, gate_qubit1[two_qubit]))
+        slot_index = np.concatenate((2 * gate_ids, 2 * gate_ids[two_qubit] + 1))
+        order = np.lexsort((slot_gate, slot_qubit))
+        slot_gate, slot_qubit, slot_index = slot_gate[order], slot_qubit[order], slot_index[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = slot_qubit[1:] != slot_qubit[:-1]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = first[1:]
+        # the first gate of a qubit depends on Init, the others on the previous gate of the qubit
+        previous = np.zeros(len(order), dtype=np.int64)
+        previous[1:] = slot_gate[:-1]
+        previous[first] = 0
+        predecessors = np.full(2 * rows, -1, dtype=np.int32)
+        predecessors[slot_index] = previous
+        successors = np.full(2 * rows, -1, dtype=np.int32)
+        successors[slot_index[~last]] = slot_gate[1:][~first[1:]]
+        qc.gate_predecessors = array('i', predecessors.tobytes())
+        qc.gate_successors = array('i', successors.tobytes())
+        qc.init_successors = np.unique(slot_gate[first]).tolist()
+        qc.gate_layers = array('i', layers.tobytes())
+        last_qubit = slot_qubit[last].tolist()
+        for qubit, gate, slot in zip(last_qubit, slot_gate[last].tolist(), slot_index[last].tolist()):
+            qc.last_gate_on_qubit[qubit] = gate
+            qc.last_slot_on_qubit[qubit] = slot
+            qc.qubit_depth[qubit] = int(layers[gate]) + 2
+        qc.circuit_depth = max(qc.qubit_depth, default=1)
+        qc.gate_number = rows
+        qc.gate_set = {GATE_NAMES[code] for code in np.unique(np.asarray(opcode)).tolist()}
+        return qc
+
+    @classmethod
+    def from_binary(cls, filename, mmap=True):
+        '''
+        read a circuit written by to_binary, see quantumcircuit.binary
+        :param filename:
+        :param mmap: map the file instead of reading it, the columns then share the page cache
+        :return: compact lazy_dag QuantumCircuit
+        '''
+        from quantumcircuit.binary import read_binary
+        return read_binary(filename, mmap)
+
+    def to_binary(self, filename, dagtable=True):
+        '''
+        write the circuit in the binary format of quantumcircuit.binary
+        :param filename:
+        :param dagtable: also store the dagtable, so readers do not rebuild it
+        '''
+        from quantumcircuit.binary import write_binary
+        write_binary(self, filename, dagtable)
+
+    @classmethod
+    def from_QASM(cls, filename, compact=False, lazy_dag=False, verbose=False):
+        '''
+        read a qasm file with the single pass QASMParser
+        :param filename:
+        :param compact: see QuantumCircuit.__init__
+        :param lazy_dag: see QuantumCircuit.__init__
+        :param verbose: print the parse throughput and the unsupported gates
+        :return: QuantumCircuit, None if the file can not be parsed
+        '''
+        from quantumcircuit.qasm import QASMParser
         try:
-            with open(filename, "r") as file:
-                f = file.readlines()
-                for i in range(len(f)):
-                    if "OPENQASM" in f[i] or "include \"qelib1.inc\"" in f[i] or "creg" in f[i]:
-                        continue
-                    elif "qreg" in f[i]:
-                        numbers = re.findall(r'\d+', f[i])
-                        qubit_num = int(numbers[0])
-                        qc = QuantumCircuit(qubit_num)
-                    elif f[i] == '\n' or '//' in f[i]:
-                        continue
-                    else:
-                        pattern = r'^[a-zA-Z]+'
-                        match = re.match(pattern, f[i])
-                        gate_name = match[0].upper()
-                        if gate_name == "X" or gate_name == "Y" or gate_name == "Z" or gate_name == "H" or gate_name == "S" or gate_name == "T" or gate_name == "TDG":
-                            numbers = re.findall(r'\d+', f[i])
-                            qubit_num = int(numbers[0])
-                            module = importlib.import_module("quantumcircuit.gate")
-                            function = getattr(module, gate_name)
-                            newgate = function(qubit_num)
-                            qc.add_gate(newgate)
-                        elif gate_name == "RX" or gate_name == "RZ":
-                            pattern = r"(-?\d+\.?\d*)"
-                            matches = re.findall(pattern, f[i])
-                            qubit = int(matches[1])
-                            theta = float(matches[0])
-                            module = importlib.import_module("quantumcircuit.gate")
-                            function = getattr(module, gate_name)
-                            newgate = function(qubit, theta)
-                            qc.add_gate(newgate)
-                        elif gate_name == "CX":
-                            numbers = re.findall(r'\d+', f[i])
-                            q1 = int(numbers[0])
-                            q2 = int(numbers[1])
-                            newgate = CX(q1, q2)
-                            qc.add_gate(newgate)
-                        elif gate_name == "U":
-                            pattern = r"(-?\d+\.?\d*)"
-                            matches = re.findall(pattern, f[i])
-                            qubit = int(matches[-1])
-                            # theta = float(matches[0])
-                            module = importlib.import_module("quantumcircuit.gate")
-                            function = getattr(module, 'X')
-                            newgate = function(qubit)
-                            qc.add_gate(newgate)
-                        else:
-                            print("not supported gate")
-
-                return qc
+            parser = QASMParser(compact=compact, lazy_dag=lazy_dag)
+            qc = parser.parse(filename)
+            if verbose:
+                parser.report()
+            return qc
         except Exception as e:
             print("Error in reading qasm file:", e)
 
@@ -311,51 +510,7 @@ class QuantumCircuit:
         for i in ready_file:
             if compare_strings(i, data):
                 filename = i
-        with open(filename, "r") as file:
-            f = file.readlines()
-            qubit_number = 0
-            for i in range(len(f)):
-                if "qreg" in f[i]:
-                    numbers = re.findall(r'\d+', f[i])
-                    qubit_number = int(numbers[0])
-            qc = QuantumCircuit(qubit_number)
-            for i in range(len(f)):
-                if "OPENQASM" in f[i] or "include \"qelib1.inc\"" in f[i] or "creg" in f[i] or "\n" == f[i]:
-                    continue
-                elif "qreg" in f[i]:
-                    pass
-                    # numbers = re.findall(r'\d+', f[i])
-                    # qubit_num=int(numbers[0])
-                    # qc=QuantumCircuit(qubit_num)
-                else:
-                    pattern = r'^[a-zA-Z]+'
-                    match = re.match(pattern, f[i])
-                    gate_name = match[0].upper()
-                    if gate_name == "X" or gate_name == "Y" or gate_name == "Z" or gate_name == "H" or gate_name == "S" or gate_name == "T" or gate_name == "TDG":
-                        numbers = re.findall(r'\d+', f[i])
-                        qubit_num = int(numbers[0])
-                        module = importlib.import_module("quantumcircuit.gate")
-                        function = getattr(module, gate_name)
-                        newgate = function(qubit_num)
-                        qc.add_gate(newgate)
-                    elif gate_name == "RX" or gate_name == "RZ":
-                        pattern = r"(-?\d+\.?\d*)"
-                        matches = re.findall(pattern, f[i])
-                        qubit = int(matches[1])
-                        theta = float(matches[0])
-                        module = importlib.import_module("quantumcircuit.gate")
-                        function = getattr(module, gate_name)
-                        newgate = function(qubit, theta)
-                        qc.add_gate(newgate)
-                    elif gate_name == "CX":
-                        numbers = re.findall(r'\d+', f[i])
-                        q1 = int(numbers[0])
-                        q2 = int(numbers[1])
-                        newgate = CX(q1, q2)
-                        qc.add_gate(newgate)
-                    else:
-                        print("not supported gate")
-            return qc
+        return cls.from_QASM(filename)
 
     @classmethod
     def random_circuit(cls, num_qubits, depth, gate1p, gate2p, gate_set=None):
@@ -473,36 +628,23 @@ class QuantumCircuit:
 
     def to_dagtable(self):
         '''
-        dagtable: 2D list
-        Each column of dagtable is a logical qubit,
-        and each row is a time slice.
+        dagtable: 2D int32 ndarray, shape (qubit_number, circuit depth - 1)
+        Each row of dagtable is a logical qubit,
+        and each column is a time slice.
         If it is -1, it means that this time period is free,
         otherwise, it means the id of the gate to be executed.
+        The table is built once from gate_layers and cached until the next add_gate,
+        the returned array is shared and read-only.
         :return:
         '''
-        # generate dagtable
-        dagtable = [[] for _ in range(self.qubit_number)]
-        # add gate from gate list
-        for i in range(len(self.gate_list)):
-            gate = self.gate_list[i]
-            if gate.name == "Init":
-                continue
-            qubits = gate.get_qubits()
-            if len(qubits) == 1:
-                dagtable[qubits[0]].append(i)
-            else:
-                while (len(dagtable[qubits[0]]) < len(dagtable[qubits[1]])):
-                    dagtable[qubits[0]].append(-1)
-                while (len(dagtable[qubits[0]]) > len(dagtable[qubits[1]])):
-                    dagtable[qubits[1]].append(-1)
-                dagtable[qubits[0]].append(i)
-                dagtable[qubits[1]].append(i)
-        # complete
-        max_length = max(len(row) for row in dagtable)
-        for i in range(len(dagtable)):
-            while len(dagtable[i]) < max_length:
-                dagtable[i].append(-1)
-        return dagtable
+        if self._dagtable is None:
+            qubit0, qubit1 = self.get_gate_qubits()
+            layers = self.get_gate_layers()[1:]
+            dagtable = build_dagtable(self.qubit_number, self.circuit_depth - 1,
+                                      np.arange(1, self.gate_number, dtype=np.int32), qubit0, qubit1, layers)
+            dagtable.flags.writeable = False
+            self._dagtable = dagtable
+        return self._dagtable
 
     def front_layer(self):
         dagtable = self.to_dagtable()
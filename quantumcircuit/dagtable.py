@@ -0,0 +1,44 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+
+
+def build_dagtable(qubit_number, layer_number, gate_ids, qubit0, qubit1, layers):
+    '''
+    vectorized dagtable construction from a per-gate layer assignment
+    :param qubit_number: rows of the table
+    :param layer_number: columns of the table
+    :param gate_ids: id written in the table for each gate
+    :param qubit0: first qubit of each gate
+    :param qubit1: second qubit of each gate, -1 for single-qubit gates
+    :param layers: column of each gate
+    :return: int32 ndarray of shape (qubit_number, layer_number), -1 where the qubit is free
+    '''
+    dagtable = np.full((qubit_number, layer_number), -1, dtype=np.int32)
+    gate_ids = np.asarray(gate_ids, dtype=np.int32)
+    qubit1 = np.asarray(qubit1)
+    layers = np.asarray(layers)
+    dagtable[np.asarray(qubit0), layers] = gate_ids
+    two_qubit = qubit1 != -1
+    dagtable[qubit1[two_qubit], layers[two_qubit]] = gate_ids[two_qubit]
+    return dagtable
+
+
+def assign_layers(qubit_number, qubit0, qubit1):
+    '''
+    ASAP layering of a gate sequence, the same columns add_gate gives in a QuantumCircuit
+    :param qubit_number:
+    :param qubit0: first qubit of each gate, in program order
+    :param qubit1: second qubit of each gate, -1 for single-qubit gates
+    :return: int32 ndarray, dagtable column of each gate
+    '''
+    qubit_depth = [0] * qubit_number
+    layers = np.empty(len(qubit0), dtype=np.int32)
+    for index, (q0, q1) in enumerate(zip(np.asarray(qubit0).tolist(), np.asarray(qubit1).tolist())):
+        if q1 == -1:
+            layer = qubit_depth[q0]
+            qubit_depth[q0] = layer + 1
+        else:
+            layer = max(qubit_depth[q0], qubit_depth[q1])
+            qubit_depth[q0] = qubit_depth[q1] = layer + 1
+        layers[index] = layer
+    return layers
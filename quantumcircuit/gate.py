@@ -4,16 +4,18 @@ def is_symbol_input(obj):
     return isinstance(obj, sp.Symbol)
 
 class Gate:
+    __slots__ = ("name", "is_symbol")
+    # shared by every gate instead of being rebuilt in each __init__
+    gateset = frozenset({"X", "Y", "Z", "H", "S", "T", "CX", "RX", "RZ", "TDG"})
 
     @classmethod
     def supported_gate_set(cls):
-        return {"X", "Y", "Z", "H", "S", "T", "CX", "RX", "RZ", "TDG"}
+        return set(cls.gateset)
 
 
     def __init__(self, name):
         self.name = name
         self.is_symbol = False
-        self.gateset = {"X", "Y", "Z", "H", "S", "T", "CX", "RX", "RZ", "TDG"}
 
     def get_name(self):
         return self.name
@@ -23,7 +25,7 @@ class Gate:
 
 
 class X(Gate):
-
+    __slots__ = ("qubit",)
 
     def __init__(self, qubit):
         name = "X"
@@ -35,6 +37,8 @@ class X(Gate):
 
 
 class Y(Gate):
+    __slots__ = ("qubit",)
+
     def __init__(self, qubit):
         name = "Y"
         super().__init__(name)
@@ -45,6 +49,8 @@ class Y(Gate):
 
 
 class Z(Gate):
+    __slots__ = ("qubit",)
+
     def __init__(self, qubit):
         name = "Z"
         super().__init__(name)
@@ -55,6 +61,8 @@ class Z(Gate):
 
 
 class H(Gate):
+    __slots__ = ("qubit",)
+
     def __init__(self, qubit):
         name = "H"
         super().__init__(name)
@@ -65,6 +73,8 @@ class H(Gate):
 
 
 class T(Gate):
+    __slots__ = ("qubit",)
+
     def __init__(self, qubit):
         name = "T"
         super().__init__(name)
@@ -74,6 +84,8 @@ class T(Gate):
         return [self.qubit]
 
 class TDG(Gate):
+    __slots__ = ("qubit",)
+
     def __init__(self, qubit):
         name = "TDG"
         super().__init__(name)
@@ -84,6 +96,8 @@ class TDG(Gate):
 
 
 class S(Gate):
+    __slots__ = ("qubit",)
+
     def __init__(self, qubit):
         name = "S"
         super().__init__(name)
@@ -94,6 +108,8 @@ class S(Gate):
 
 
 class RX(Gate):
+    __slots__ = ("qubit", "para")
+
     def __init__(self, qubit, para):
         name = "RX"
         super().__init__(name)
@@ -117,6 +133,8 @@ class RX(Gate):
 
 
 class RZ(Gate):
+    __slots__ = ("qubit", "para")
+
     def __init__(self, qubit, para):
         name = "RZ"
         super().__init__(name)
@@ -139,6 +157,8 @@ class RZ(Gate):
 
 
 class RY(Gate):
+    __slots__ = ("qubit", "para")
+
     def __init__(self, qubit, para):
         name = "RY"
         super().__init__(name)
@@ -160,6 +180,8 @@ class RY(Gate):
         return RY(self.qubit,para1)
 
 class P(Gate):
+    __slots__ = ("qubit", "para")
+
     def __init__(self, qubit, para):
         name = "P"
         super().__init__(name)
@@ -182,6 +204,8 @@ class P(Gate):
 
 
 class CX(Gate):
+    __slots__ = ("control_qubit", "target_qubit")
+
     def __init__(self, control_qubit, target_qubit):
         name = "CX"
         super().__init__(name)
@@ -195,6 +219,8 @@ class CX(Gate):
         return [self.control_qubit, self.target_qubit]
 
 class CRY(Gate):
+    __slots__ = ("control_qubit", "target_qubit", "para")
+
     def __init__(self, control_qubit, target_qubit,para):
         name = "CRY"
         super().__init__(name)
@@ -220,6 +246,8 @@ class CRY(Gate):
         return CRY(self.control_qubit,self.target_qubit,para1)
 
 class Init(Gate):
+    __slots__ = ("qubit",)
+
     def __init__(self, qubit):
         name = "Init"
         super().__init__(name)
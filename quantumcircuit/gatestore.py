@@ -0,0 +1,166 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+from quantumcircuit.gate import *
+
+# opcode i <-> GATE_NAMES[i]; the order is part of the on-disk/in-memory layout
+GATE_NAMES = ("Init", "X", "Y", "Z", "H", "S", "T", "TDG", "RX", "RY", "RZ", "P", "CX", "CRY")
+GATE_OPCODES = {name: opcode for opcode, name in enumerate(GATE_NAMES)}
+GATE_CLASSES = {"X": X, "Y": Y, "Z": Z, "H": H, "S": S, "T": T, "TDG": TDG,
+                "RX": RX, "RY": RY, "RZ": RZ, "P": P, "CX": CX, "CRY": CRY}
+OP_INIT = GATE_OPCODES["Init"]
+PARA_OPCODES = frozenset(GATE_OPCODES[name] for name in ("RX", "RY", "RZ", "P", "CRY"))
+TWO_QUBIT_OPCODES = frozenset(GATE_OPCODES[name] for name in ("CX", "CRY"))
+
+
+class GateView:
+    '''
+    Lightweight read-only handle on one row of a GateStore.
+    It answers the same questions as a Gate object (name, qubits, para)
+    without allocating one per gate.
+    '''
+    __slots__ = ("store", "index")
+    is_symbol = False
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def name(self):
+        return GATE_NAMES[self.store.opcode[self.index]]
+
+    def get_name(self):
+        return self.name
+
+    def get_qubits(self):
+        store = self.store
+        index = self.index
+        opcode = store.opcode[index]
+        if opcode == OP_INIT:
+            return list(range(store.qubit_number))
+        if opcode in TWO_QUBIT_OPCODES:
+            return [int(store.qubit0[index]), int(store.qubit1[index])]
+        return [int(store.qubit0[index])]
+
+    def get_para(self):
+        if self.store.opcode[self.index] in PARA_OPCODES:
+            return float(self.store.para[self.index])
+        return None
+
+    def to_gate(self):
+        '''
+        materialize the row as a regular Gate object
+        :return: Gate
+        '''
+        opcode = self.store.opcode[self.index]
+        if opcode == OP_INIT:
+            return Init(self.store.qubit_number)
+        gate_class = GATE_CLASSES[GATE_NAMES[opcode]]
+        args = self.get_qubits()
+        if opcode in PARA_OPCODES:
+            args.append(self.get_para())
+        return gate_class(*args)
+
+    def __repr__(self):
+        return "GateView(%s, %s)" % (self.name, self.get_qubits())
+
+
+class GateStore:
+    '''
+    Columnar storage for the gate list of a QuantumCircuit.
+    Each gate is one row of four NumPy columns: opcode, qubit0, qubit1 and para.
+    qubit1 is -1 for single-qubit gates and para is 0 for gates without parameter.
+    The store behaves like the gate list (len, indexing, iteration, append)
+    and hands out GateView objects, while the columns can be used directly for
+    vectorized processing.
+    '''
+
+    def __init__(self, qubit_number, capacity=1024):
+        self.qubit_number = qubit_number
+        self.size = 0
+        capacity = max(int(capacity), 1)
+        self.opcode = np.empty(capacity, dtype=np.int8)
+        self.qubit0 = np.empty(capacity, dtype=np.int32)
+        self.qubit1 = np.empty(capacity, dtype=np.int32)
+        self.para = np.empty(capacity, dtype=np.float64)
+
+    def _grow(self):
+        capacity = 2 * len(self.opcode)
+        for column in ("opcode", "qubit0", "qubit1", "para"):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, column, new)
+
+    def append_row(self, opcode, qubit0, qubit1=-1, para=0.0):
+        if self.size == len(self.opcode):
+            self._grow()
+        index = self.size
+        self.opcode[index] = opcode
+        self.qubit0[index] = qubit0
+        self.qubit1[index] = qubit1
+        self.para[index] = para
+        self.size = index + 1
+        return index
+
+    def append(self, gate):
+        '''
+        append a Gate object or a GateView (possibly from another store)
+        :param gate:
+        :return: row index of the new gate
+        '''
+        if isinstance(gate, GateView):
+            store = gate.store
+            index = gate.index
+            return self.append_row(store.opcode[index], store.qubit0[index], store.qubit1[index], store.para[index])
+        name = gate.get_name()
+        if name not in GATE_OPCODES:
+            raise ValueError(name + " is not supported by GateStore")
+        opcode = GATE_OPCODES[name]
+        if opcode == OP_INIT:
+            return self.append_row(opcode, -1)
+        if gate.is_symbol:
+            raise ValueError("symbolic parameters are not supported by GateStore")
+        qubits = gate.get_qubits()
+        qubit1 = qubits[1] if len(qubits) > 1 else -1
+        para = gate.get_para() if opcode in PARA_OPCODES else 0.0
+        return self.append_row(opcode, qubits[0], qubit1, para)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [GateView(self, i) for i in range(*index.indices(self.size))]
+        index = int(index)
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("gate index out of range")
+        return GateView(self, index)
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield GateView(self, index)
+
+    def opcodes(self):
+        return self.opcode[:self.size]
+
+    def qubits0(self):
+        return self.qubit0[:self.size]
+
+    def qubits1(self):
+        return self.qubit1[:self.size]
+
+    def paras(self):
+        return self.para[:self.size]
+
+    def gate_counts(self):
+        '''
+        :return: {gate_name: gate_num}
+        '''
+        counts = np.bincount(self.opcodes(), minlength=len(GATE_NAMES))
+        return {GATE_NAMES[opcode]: int(count) for opcode, count in enumerate(counts) if count}
+
+    def nbytes(self):
+        return self.opcode.nbytes + self.qubit0.nbytes + self.qubit1.nbytes + self.para.nbytes
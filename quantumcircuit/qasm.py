@@ -0,0 +1,164 @@
+# -*- coding: UTF-8 -*-
+import os
+import re
+import time
+from quantumcircuit.gate import *
+
+# gate constructor tables, looked up once per statement instead of importlib/getattr
+SINGLE_QUBIT_GATES = {"x": X, "y": Y, "z": Z, "h": H, "s": S, "t": T, "tdg": TDG}
+PARAMETRIC_GATES = {"rx": RX, "rz": RZ}
+TWO_QUBIT_GATES = {"cx": CX}
+# u/u1/u2/u3 are kept as an X on the target qubit, only the qubit matters for mapping
+U_GATES = {"u", "u1", "u2", "u3"}
+SKIPPED_STATEMENTS = {"OPENQASM", "include", "creg"}
+
+_NUMBER = re.compile(r"-?\d+\.?\d*")
+
+
+class QASMParser:
+    '''
+    Single pass OpenQASM 2.0 reader.
+    The file is streamed line by line, every statement is tokenized once with
+    str operations and gates are dispatched through the constructor tables above
+    and added to the circuit immediately.
+    After parse(), self.stats holds the parse throughput.
+    '''
+
+    def __init__(self, compact=False, lazy_dag=False):
+        self.compact = compact
+        self.lazy_dag = lazy_dag
+        self.stats = {}
+        self.unsupported = {}
+
+    def parse(self, filename):
+        '''
+        :param filename: qasm file
+        :return: QuantumCircuit
+        '''
+        from quantumcircuit.circuit import QuantumCircuit
+        start = time.perf_counter()
+        self.unsupported = {}
+        registers = {}
+        qubit_number = 0
+        qc = None
+        line_number = 0
+        in_gate_body = False
+        with open(filename, "r") as file:
+            for line in file:
+                line_number += 1
+                comment = line.find("//")
+                if comment != -1:
+                    line = line[:comment]
+                if in_gate_body:
+                    # skip custom gate definitions up to the closing brace
+                    if "}" in line:
+                        in_gate_body = False
+                    continue
+                for statement in line.split(";"):
+                    statement = statement.strip()
+                    if not statement:
+                        continue
+                    name, params, args = split_statement(statement)
+                    if name in SKIPPED_STATEMENTS:
+                        continue
+                    if name == "qreg":
+                        if qc is not None:
+                            raise ValueError("qreg declared after the first gate, line %d" % line_number)
+                        register, size = parse_argument(args[0])
+                        registers[register] = qubit_number
+                        qubit_number += size
+                        continue
+                    if name == "gate" or name == "opaque":
+                        in_gate_body = "}" not in line
+                        break
+                    if qc is None:
+                        if not registers:
+                            raise ValueError("gate before qreg, line %d" % line_number)
+                        qc = QuantumCircuit(qubit_number, compact=self.compact, lazy_dag=self.lazy_dag)
+                    gate = self.make_gate(name, params, args, registers)
+                    if gate is None:
+                        self.unsupported[name] = self.unsupported.get(name, 0) + 1
+                    else:
+                        qc.add_gate(gate)
+        if qc is None:
+            if not registers:
+                raise ValueError("no qreg in " + filename)
+            qc = QuantumCircuit(qubit_number, compact=self.compact, lazy_dag=self.lazy_dag)
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(filename)
+        gates = qc.get_gate_number() - 1
+        self.stats = {
+            "bytes": size,
+            "lines": line_number,
+            "gates": gates,
+            "time": seconds,
+            "gates_per_second": gates / seconds if seconds > 0 else float("inf"),
+            "mb_per_second": size / 1e6 / seconds if seconds > 0 else float("inf"),
+        }
+        return qc
+
+    def make_gate(self, name, params, args, registers):
+        '''
+        build the Gate of one statement, None if the gate is not supported
+        '''
+        if name in SINGLE_QUBIT_GATES:
+            return SINGLE_QUBIT_GATES[name](qubit_index(args[0], registers))
+        if name in TWO_QUBIT_GATES:
+            return TWO_QUBIT_GATES[name](qubit_index(args[0], registers), qubit_index(args[1], registers))
+        if name in PARAMETRIC_GATES:
+            return PARAMETRIC_GATES[name](qubit_index(args[0], registers), parse_parameter(params))
+        if name in U_GATES:
+            return X(qubit_index(args[-1], registers))
+        return None
+
+    def report(self):
+        stats = self.stats
+        print("parsed {} gates, {:.2f} MB in {:.3f} s ({:.0f} gates/s, {:.2f} MB/s)".format(
+            stats["gates"], stats["bytes"] / 1e6, stats["time"], stats["gates_per_second"], stats["mb_per_second"]))
+        if self.unsupported:
+            print("not supported gate:", self.unsupported)
+
+
+def split_statement(statement):
+    '''
+    "rz(0.5) q[1]" -> ("rz", "0.5", ["q[1]"])
+    "cx q[0],q[1]" -> ("cx", None, ["q[0]", "q[1]"])
+    '''
+    params = None
+    paren = statement.find("(")
+    space = statement.find(" ")
+    if paren != -1 and (space == -1 or paren < space):
+        name = statement[:paren]
+        close = statement.rfind(")")
+        params = statement[paren + 1:close]
+        rest = statement[close + 1:]
+    elif space != -1:
+        name = statement[:space]
+        rest = statement[space + 1:]
+    else:
+        return statement, None, []
+    return name, params, [arg.strip() for arg in rest.split(",")]
+
+
+def parse_parameter(params):
+    '''
+    plain numbers are read as they are, for expressions such as "pi*-0.5"
+    the first number is kept, as the former regex reader did
+    '''
+    try:
+        return float(params)
+    except ValueError:
+        return float(_NUMBER.search(params).group())
+
+
+def parse_argument(arg):
+    '''
+    "q[3]" -> ("q", 3)
+    '''
+    bracket = arg.find("[")
+    return arg[:bracket].strip(), int(arg[bracket + 1:arg.find("]", bracket)])
+
+
+def qubit_index(arg, registers):
+    register, index = parse_argument(arg)
+    return registers[register] + index
@@ -0,0 +1,211 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+from quantumcircuit.circuit import QuantumCircuit
+from quantumcircuit.dagtable import build_dagtable, assign_layers
+from quantumcircuit.gatestore import GATE_NAMES
+
+
+class ViewGateList:
+    '''
+    gate_list of a CircuitView: item 0 is the Init of the parent, item i the i-th selected gate.
+    Items are looked up in the parent gate list on access, nothing is copied.
+    '''
+    __slots__ = ("parent_gates", "gate_ids")
+
+    def __init__(self, parent_gates, gate_ids):
+        self.parent_gates = parent_gates
+        self.gate_ids = gate_ids
+
+    def __len__(self):
+        return len(self.gate_ids) + 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("gate index out of range")
+        if index == 0:
+            return self.parent_gates[0]
+        return self.parent_gates[int(self.gate_ids[index - 1])]
+
+    def __iter__(self):
+        yield self.parent_gates[0]
+        for gate_id in self.gate_ids.tolist():
+            yield self.parent_gates[gate_id]
+
+
+class CircuitView:
+    '''
+    A slice of a QuantumCircuit given by the ids of its gates in the parent circuit.
+    Only the parent reference and the id array are kept, the gates are not copied.
+    Ids are kept sorted, which is program order, so every qubit sees its gates
+    in the same order as in the parent.
+    The read API of QuantumCircuit (gate_list, to_dagtable, get_circuit_depth,
+    get_circuit_gate_info, ...) is answered lazily, gate i of the view is gate_ids[i - 1]
+    of the parent and Init keeps id 0.
+    '''
+
+    def __init__(self, parent, gate_ids=None, layers=None):
+        '''
+        :param parent: QuantumCircuit the gates belong to
+        :param gate_ids: ids of the selected gates in parent, all the gates after Init if None
+        :param layers: dagtable column of each selected gate inside the view,
+                       aligned with gate_ids, computed on first use if None
+        '''
+        self.parent = parent
+        if gate_ids is None:
+            gate_ids = np.arange(1, parent.get_gate_number(), dtype=np.int32)
+        else:
+            gate_ids, index = np.unique(np.asarray(gate_ids, dtype=np.int32), return_index=True)
+            if layers is not None:
+                layers = np.asarray(layers, dtype=np.int32)[index]
+        if len(gate_ids) and (gate_ids[0] < 1 or gate_ids[-1] >= parent.get_gate_number()):
+            raise ValueError("gate ids of a view must be in [1, parent gate number)")
+        self.gate_ids = gate_ids
+        self._layers = layers
+        self._dagtable = None
+
+    @classmethod
+    def from_layers(cls, parent, start, stop):
+        '''
+        view on the dagtable layers [start, stop) of parent,
+        their layers inside the view are the parent ones shifted by start
+        :param parent: QuantumCircuit
+        :param start: first layer
+        :param stop: layer after the last one
+        :return: CircuitView
+        '''
+        layers = parent.get_gate_layers()[1:]
+        gate_ids = np.flatnonzero((layers >= start) & (layers < stop))
+        return cls(parent, gate_ids + 1, layers[gate_ids] - start)
+
+    @property
+    def qubit_number(self):
+        return self.parent.get_qubit_number()
+
+    @property
+    def cbit_number(self):
+        return self.parent.cbit_number
+
+    @property
+    def compact(self):
+        return self.parent.compact
+
+    @property
+    def gate_list(self):
+        return ViewGateList(self.parent.gate_list, self.gate_ids)
+
+    def get_qubit_number(self):
+        return self.parent.get_qubit_number()
+
+    def get_gate_number(self):
+        '''
+        :return: gates of the slice, Init included as in QuantumCircuit
+        '''
+        return len(self.gate_ids) + 1
+
+    def get_gate(self, gate_id):
+        return self.gate_list[gate_id]
+
+    def get_gate_qubits(self):
+        '''
+        :return: (qubit0, qubit1) int32 ndarrays of the selected gates, see QuantumCircuit.get_gate_qubits
+        '''
+        qubit0, qubit1 = self.parent.get_gate_qubits()
+        return qubit0[self.gate_ids - 1], qubit1[self.gate_ids - 1]
+
+    def get_gate_columns(self):
+        '''
+        :return: (opcode, qubit0, qubit1, para) ndarrays of the selected gates, see QuantumCircuit.get_gate_columns
+        '''
+        index = self.gate_ids - 1
+        return tuple(column[index] for column in self.parent.get_gate_columns())
+
+    def _view_layers(self):
+        if self._layers is None:
+            qubit0, qubit1 = self.get_gate_qubits()
+            self._layers = assign_layers(self.get_qubit_number(), qubit0, qubit1)
+        return self._layers
+
+    def get_gate_layers(self):
+        '''
+        :return: int32 ndarray, dagtable column of every gate of the view, -1 for Init
+        '''
+        return np.concatenate((np.array([-1], dtype=np.int32), self._view_layers()))
+
+    def get_circuit_depth(self):
+        '''
+        number of gates on the longest path of the DAG, Init included
+        '''
+        if len(self.gate_ids) == 0:
+            return 1
+        return int(self._view_layers().max()) + 2
+
+    def to_dagtable(self):
+        '''
+        dagtable of the slice alone, see QuantumCircuit.to_dagtable,
+        ids in the table are ids of the view (1 .. gate number - 1)
+        :return: read-only int32 ndarray
+        '''
+        if self._dagtable is None:
+            qubit0, qubit1 = self.get_gate_qubits()
+            dagtable = build_dagtable(self.get_qubit_number(), self.get_circuit_depth() - 1,
+                                      np.arange(1, self.get_gate_number(), dtype=np.int32),
+                                      qubit0, qubit1, self._view_layers())
+            dagtable.flags.writeable = False
+            self._dagtable = dagtable
+        return self._dagtable
+
+    def get_circuit_gate_info(self):
+        '''
+        :return: {gate_name: gate_num}, Init included as in QuantumCircuit
+        '''
+        if self.parent.compact:
+            opcodes = self.parent.gate_list.opcodes()[np.concatenate(([0], self.gate_ids))]
+            counts = np.bincount(opcodes, minlength=len(GATE_NAMES))
+            return {GATE_NAMES[opcode]: int(count) for opcode, count in enumerate(counts) if count}
+        gate_name_num = {}
+        for gate in self.gate_list:
+            gate_name = gate.get_name()
+            gate_name_num[gate_name] = gate_name_num.get(gate_name, 0) + 1
+        return gate_name_num
+
+    def to_circuit(self, compact=None, lazy_dag=True):
+        '''
+        copy the selected gates into a standalone QuantumCircuit
+        :param compact: see QuantumCircuit.__init__, same as the parent if None
+        :param lazy_dag: see QuantumCircuit.__init__
+        :return: QuantumCircuit
+        '''
+        if compact is None:
+            compact = self.parent.compact
+        circuit = QuantumCircuit(qubit_number=self.get_qubit_number(), compact=compact, lazy_dag=lazy_dag)
+        gate_list = self.parent.gate_list
+        for gate_id in self.gate_ids.tolist():
+            circuit.add_gate(gate_list[gate_id])
+        return circuit
+
+    def to_QASM(self, filename):
+        # the writer of QuantumCircuit only reads qubit_number, cbit_number and gate_list
+        QuantumCircuit.to_QASM(self, filename)
+
+    def __len__(self):
+        return len(self.gate_ids)
+
+    def __reduce__(self):
+        if self.parent.binary_path is not None:
+            # the receiving process maps the same file, only the ids travel
+            return _binary_view, (self.parent.binary_path, self.gate_ids, self._layers)
+        # ship only the selected gates to another process, not the whole parent
+        return CircuitView, (self.to_circuit(compact=True),)
+
+    def __repr__(self):
+        return "CircuitView(%d qubits, %d gates)" % (self.get_qubit_number(), len(self.gate_ids))
+
+
+def _binary_view(path, gate_ids, layers):
+    from quantumcircuit.binary import load_binary
+    return CircuitView(load_binary(path), gate_ids, layers)
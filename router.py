@@ -0,0 +1,267 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : router.py
+# @IDE     : PyCharm
+"""
+Built-in SWAP router, a pure-Python/NumPy backend for compile().
+
+Front-layer routing with lookahead: gates whose qubits are adjacent on the chip are
+executed, otherwise the SWAP on an edge touching the front layer that minimizes
+    mean distance of the front layer + weight * mean distance of the next `lookahead` cnots
+is inserted. All candidate SWAPs are scored at once against the all-pairs distance matrix
+of the chip's CouplingGraph. Of the EEQM_scale strategies, nogreedy scores with the lookahead
+and greedy with the front layer only (see STRATEGIES), others are rejected.
+The result is the record of compile_result.CompileResult;
+a SWAP counts as 3 CNOTs in the depth.
+"""
+import json
+import time
+import numpy as np
+from coupling_graph import load_coupling
+
+# strategy -> route_arrays options
+STRATEGIES = {
+    "nogreedy": {"lookahead": 20, "weight": 0.5},
+    "greedy": {"lookahead": 0, "weight": 0.0},
+}
+
+
+def strategy_options(strategy):
+    """
+    Returns:
+        the route_arrays options of strategy, ValueError if the built-in router does not implement it
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError("built-in router does not support strategy {}, only {}".format(
+            strategy, ", ".join(STRATEGIES)))
+    return STRATEGIES[strategy]
+
+def place_qubits(qubit_number, device_qubits, initial_mapping):
+    """
+    Args:
+        initial_mapping: list or "[...]" string in the initial_map convention,
+                         position p holds the logical qubit placed on physical qubit p
+
+    Returns:
+        (logical_to_physical, physical_to_logical), unplaced logical qubits take the free physical qubits
+    """
+    if qubit_number > device_qubits:
+        raise ValueError("circuit has %d qubits, chip has %d" % (qubit_number, device_qubits))
+    if isinstance(initial_mapping, str):
+        initial_mapping = json.loads(initial_mapping)
+    if not initial_mapping:
+        initial_mapping = list(range(qubit_number))
+    logical_to_physical = [-1] * qubit_number
+    physical_to_logical = [-1] * device_qubits
+    for physical, logical in enumerate(initial_mapping[:device_qubits]):
+        if 0 <= logical < qubit_number and logical_to_physical[logical] == -1:
+            logical_to_physical[logical] = physical
+            physical_to_logical[physical] = logical
+    free = [physical for physical in range(device_qubits) if physical_to_logical[physical] == -1]
+    for logical in range(qubit_number):
+        if logical_to_physical[logical] == -1:
+            physical = free.pop(0)
+            logical_to_physical[logical] = physical
+            physical_to_logical[physical] = logical
+    return logical_to_physical, physical_to_logical
+
+
+def swap_costs(distance, candidates, pairs):
+    """
+    Args:
+        candidates: (C, 2) physical SWAPs
+        pairs: (K, 2) physical qubits of cnots
+
+    Returns:
+        (C,) total distance of the cnots after each candidate SWAP
+    """
+    a = candidates[:, 0, None, None]
+    b = candidates[:, 1, None, None]
+    moved = pairs[None, :, :]
+    moved = np.where(moved == a, b, np.where(moved == b, a, moved))
+    return distance[moved[:, :, 0], moved[:, :, 1]].sum(axis=1)
+
+
+def route_arrays(qubit_number, qubit0, qubit1, chip_path, initial_mapping=None,
+                 lookahead=20, weight=0.5, decay_step=0.001):
+    """
+    Args:
+        qubit0, qubit1: qubits of every gate, qubit1 is -1 for single-qubit gates
+
+    Returns:
+        {"compiler_time", "compiler_depth", "swap_count", "final_mapping", "phase_times"},
+        see compile_result.CompileResult
+    """
+    start = time.perf_counter()
+    coupling = load_coupling(chip_path)
+    adjacency = coupling.neighbors
+    distance = coupling.distance
+    device_qubits = coupling.qubit_number
+    logical_to_physical, physical_to_logical = place_qubits(qubit_number, device_qubits, initial_mapping)
+    gate_number = len(qubit0)
+    # SWAPs keep every qubit in its connected component of the chip (BFS distance device_qubits
+    # means unreachable), so a cnot between two components could never be routed
+    for gate in range(gate_number):
+        if qubit1[gate] != -1 and \
+                distance[logical_to_physical[qubit0[gate]], logical_to_physical[qubit1[gate]]] >= device_qubits:
+            raise ValueError("qubits %d and %d of gate %d are placed on disconnected parts of %s" % (
+                qubit0[gate], qubit1[gate], gate, chip_path))
+    # gates of every logical qubit in program order, head[q] is the next one to run
+    qubit_gates = [[] for _ in range(qubit_number)]
+    for gate in range(gate_number):
+        qubit_gates[qubit0[gate]].append(gate)
+        if qubit1[gate] != -1:
+            qubit_gates[qubit1[gate]].append(gate)
+    head = [0] * qubit_number
+    placed = time.perf_counter()
+
+    def ready(gate):
+        q0 = qubit0[gate]
+        q1 = qubit1[gate]
+        if qubit_gates[q0][head[q0]] != gate:
+            return False
+        return q1 == -1 or qubit_gates[q1][head[q1]] == gate
+
+    front = set()
+    for q in range(qubit_number):
+        if qubit_gates[q] and ready(qubit_gates[q][0]):
+            front.add(qubit_gates[q][0])
+    depth = [0] * device_qubits
+    decay = np.ones(device_qubits)
+    swap_count = 0
+    stalled = 0
+    while front:
+        executed = [gate for gate in front
+                    if qubit1[gate] == -1
+                    or distance[logical_to_physical[qubit0[gate]], logical_to_physical[qubit1[gate]]] == 1]
+        if executed:
+            while executed:
+                gate = executed.pop()
+                front.discard(gate)
+                p0 = logical_to_physical[qubit0[gate]]
+                if qubit1[gate] == -1:
+                    depth[p0] += 1
+                    touched = (qubit0[gate],)
+                else:
+                    p1 = logical_to_physical[qubit1[gate]]
+                    depth[p0] = depth[p1] = max(depth[p0], depth[p1]) + 1
+                    touched = (qubit0[gate], qubit1[gate])
+                for q in touched:
+                    head[q] += 1
+                    if head[q] < len(qubit_gates[q]):
+                        successor = qubit_gates[q][head[q]]
+                        if successor not in front and ready(successor):
+                            front.add(successor)
+                            q1 = qubit1[successor]
+                            if q1 == -1 or distance[logical_to_physical[qubit0[successor]],
+                                                    logical_to_physical[q1]] == 1:
+                                executed.append(successor)
+            decay[:] = 1
+            stalled = 0
+            continue
+        front_pairs = np.array([[logical_to_physical[qubit0[gate]], logical_to_physical[qubit1[gate]]]
+                                for gate in front])
+        if stalled > 2 * device_qubits:
+            # safety net against SWAP cycles: walk the first front cnot along a shortest path
+            p0, p1 = front_pairs[0]
+            step = min(adjacency[p0], key=lambda n: distance[n, p1])
+            best = (int(p0), int(step))
+        else:
+            candidates = sorted({(min(p, n), max(p, n)) for p in front_pairs.ravel() for n in adjacency[p]})
+            candidates = np.array(candidates)
+            cost = swap_costs(distance, candidates, front_pairs) / len(front_pairs)
+            extended = extended_set(front, qubit0, qubit1, qubit_gates, head, lookahead)
+            if extended:
+                extended_pairs = np.array([[logical_to_physical[qubit0[gate]], logical_to_physical[qubit1[gate]]]
+                                           for gate in extended])
+                cost = cost + weight * swap_costs(distance, candidates, extended_pairs) / len(extended_pairs)
+            cost = cost * np.maximum(decay[candidates[:, 0]], decay[candidates[:, 1]])
+            best = tuple(int(p) for p in candidates[int(np.argmin(cost))])
+        a, b = best
+        la = physical_to_logical[a]
+        lb = physical_to_logical[b]
+        physical_to_logical[a], physical_to_logical[b] = lb, la
+        if la != -1:
+            logical_to_physical[la] = b
+        if lb != -1:
+            logical_to_physical[lb] = a
+        depth[a] = depth[b] = max(depth[a], depth[b]) + 3
+        decay[a] += decay_step
+        decay[b] += decay_step
+        swap_count += 1
+        stalled += 1
+    end = time.perf_counter()
+    return {
+        "compiler_time": end - start,
+        "compiler_depth": max(depth) if device_qubits else 0,
+        "swap_count": swap_count,
+        "final_mapping": logical_to_physical,
+        "phase_times": {"placement": placed - start, "routing": end - placed},
+    }
+
+
+def extended_set(front, qubit0, qubit1, qubit_gates, head, lookahead):
+    """
+    up to `lookahead` not yet executed cnots that follow the front layer on its qubits
+    """
+    extended = []
+    seen = set(front)
+    offset = 1
+    qubits = sorted({q for gate in front for q in (qubit0[gate], qubit1[gate])})
+    while len(extended) < lookahead and qubits:
+        remaining = []
+        for q in qubits:
+            position = head[q] + offset
+            if position < len(qubit_gates[q]):
+                remaining.append(q)
+                gate = qubit_gates[q][position]
+                if gate not in seen and qubit1[gate] != -1:
+                    seen.add(gate)
+                    extended.append(gate)
+                    if len(extended) == lookahead:
+                        break
+        qubits = remaining
+        offset += 1
+    return extended
+
+
+def gate_arrays(circuit):
+    """
+    Args:
+        circuit: QuantumCircuit or CircuitView
+
+    Returns:
+        (qubit0, qubit1) lists of the gates after Init, qubit1 is -1 for single-qubit gates
+    """
+    qubit0, qubit1 = circuit.get_gate_qubits()
+    return qubit0.tolist(), qubit1.tolist()
+
+
+def route(circuit, chip_path, initial_mapping=None, lookahead=20, weight=0.5, strategy=None):
+    """
+    Args:
+        circuit: QuantumCircuit or CircuitView
+        chip_path: coupling file, see coupling/
+        initial_mapping: list or "[...]" string as returned by compile.initial_map
+        strategy: nogreedy or greedy, overrides lookahead and weight if given
+
+    Returns:
+        {"compiler_time", "compiler_depth", "swap_count", "final_mapping", "phase_times"}
+    """
+    if strategy is not None:
+        options = strategy_options(strategy)
+        lookahead, weight = options["lookahead"], options["weight"]
+    qubit0, qubit1 = gate_arrays(circuit)
+    return route_arrays(circuit.get_qubit_number(), qubit0, qubit1, chip_path, initial_mapping,
+                        lookahead=lookahead, weight=weight)
@@ -0,0 +1,179 @@
+# This code is part of LINKEQ.
+#
+# (C) Copyright LINKE 2023.
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# -*- coding: utf-8 -*-
+# @File    : router_service.py
+# @IDE     : PyCharm
+"""
+Long-lived routing worker.
+
+A worker reads requests from stdin and writes responses to stdout, both framed as a
+4-byte big-endian length followed by a UTF-8 JSON object, so one process serves all
+slices instead of one EEQM_scale spawn per slice.
+
+request:  {"id", "qubit_number", "qubit0": [...], "qubit1": [...] (-1 for single-qubit gates),
+           "chip": chip file path, "strategy", "initial_mapping": [...]}
+response: {"id", "compiler_time", "compiler_depth", "swap_count", "final_mapping", "phase_times"}
+          (the record of compile_result.CompileResult) or {"id", "error"},
+          plus "cpu_time": user + system seconds the worker spent on the request
+
+Running this file starts a pure-Python worker backed by the built-in router of router.py,
+a router binary only has to speak the same protocol on its stdin/stdout to be used
+through RouterClient.
+"""
+import os
+import sys
+import json
+import struct
+import resource
+import subprocess
+from router import gate_arrays, route_arrays, strategy_options
+
+_HEADER = struct.Struct(">I")
+
+
+def write_frame(stream, message):
+    payload = json.dumps(message).encode("utf-8")
+    stream.write(_HEADER.pack(len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+
+def read_frame(stream):
+    """
+    Returns:
+        the decoded message, None at end of stream
+    """
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    (length,) = _HEADER.unpack(header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise EOFError("truncated frame")
+    return json.loads(payload.decode("utf-8"))
+
+
+def parse_mapping(initial_mapping):
+    """
+    "[3,0,1,2]" or [3, 0, 1, 2] -> [3, 0, 1, 2]
+    """
+    if initial_mapping is None:
+        return None
+    if isinstance(initial_mapping, str):
+        return json.loads(initial_mapping)
+    return [int(qubit) for qubit in initial_mapping]
+
+
+class RouterClient:
+    """
+    Keeps one routing worker process alive and sends it circuits as gate arrays.
+    """
+
+    def __init__(self, command=None):
+        """
+        Args:
+            command: argv of the worker, the pure-Python worker of this file by default
+        """
+        if command is None:
+            command = [sys.executable, os.path.abspath(__file__)]
+        self.command = command
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.request_id = 0
+
+    def route(self, circuit, chip_path, strategy="nogreedy", initial_mapping=None):
+        """
+        Returns:
+            the response record, see compile_result.CompileResult
+        """
+        qubit0, qubit1 = gate_arrays(circuit)
+        self.request_id += 1
+        write_frame(self.process.stdin, {
+            "id": self.request_id,
+            "qubit_number": circuit.get_qubit_number(),
+            "qubit0": qubit0,
+            "qubit1": qubit1,
+            "chip": os.path.abspath(chip_path),
+            "strategy": strategy,
+            "initial_mapping": parse_mapping(initial_mapping),
+        })
+        response = read_frame(self.process.stdout)
+        if response is None:
+            raise RuntimeError("router worker exited: " + " ".join(self.command))
+        if "error" in response:
+            raise RuntimeError("router worker failed: " + response["error"])
+        return response
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_clients = {}
+
+
+def get_client(command=None):
+    """
+    one RouterClient per process and worker command, created on first use,
+    so every pool worker keeps its own resident router
+    """
+    key = tuple(command) if command else None
+    if key not in _clients:
+        _clients[key] = RouterClient(command)
+    return _clients[key]
+
+
+def route_request(request):
+    """
+    answer one request with the built-in router (see router.py),
+    a strategy it does not implement is answered with an error
+    """
+    return route_arrays(request["qubit_number"], request["qubit0"], request["qubit1"], request["chip"],
+                        request.get("initial_mapping"), **strategy_options(request.get("strategy", "nogreedy")))
+
+
+def process_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def serve(route, stdin, stdout):
+    """
+    answer framed requests with route(request) until stdin is closed
+    """
+    while True:
+        request = read_frame(stdin)
+        if request is None:
+            break
+        start_cpu = process_cpu_time()
+        try:
+            response = route(request)
+        except Exception as e:
+            response = {"error": "%s: %s" % (type(e).__name__, e)}
+        response["id"] = request.get("id")
+        # the client can not see the cpu of a worker it does not wait for, see profiling.add_external_cpu
+        response["cpu_time"] = process_cpu_time() - start_cpu
+        write_frame(stdout, response)
+
+
+if __name__ == "__main__":
+    frames_out = sys.stdout.buffer
+    # keep stray prints of the router away from the framed channel
+    sys.stdout = sys.stderr
+    serve(route_request, sys.stdin.buffer, frames_out)